@@ -0,0 +1,448 @@
+# Copyright (C) 2022 Sebastien Guerri
+#
+# This file is part of pbash.
+#
+# pbash is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# pbash is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Python API to list and run commands without the cli
+"""
+
+import os
+import time
+import errno
+import signal
+import asyncio
+
+from typing import AsyncIterator, Optional, Union
+
+from .appConfig import app, Config
+from .modules.commands import commands, CommandFile
+from .modules.runner import runner, RunResult, TIMEOUT_GRACE
+from .modules.locks import locks, CommandLock
+
+
+LOCK_POLL_DELAY = 0.1
+READ_CHUNK_SIZE = 65536
+
+
+class StoreError(Exception):
+    """Error raised by the Python API
+    """
+    pass
+
+
+class Store:
+    """Store object
+    Gives access to the commands of a config section. The catalog is read once, then kept until refresh() is called
+
+    Example:
+        store = Store("DEFAULT")
+        result = store.run("example", {"user": "Sebastien", "message": "Hello World!"}, capture=True)
+        print(result.code, result.stdout.decode())
+    """
+    section: str
+    config: Config
+    path: str
+    _catalog: Optional[list[CommandFile]]
+
+    def __init__(self, section: str = "DEFAULT", rcpath: str = ""):
+        """Init class
+
+        Args:
+            section (str, optional): config section. Defaults to "DEFAULT".
+            rcpath (str, optional): config file path. Defaults to the user config file.
+
+        Raises:
+            StoreError: the config section cannot be loaded
+        """
+        self.section = section
+        self.config = Config(rcpath or app.default_rcpath())
+        if not self.config.load(section):
+            raise StoreError(f"Cannot load section <{section}> of config file")
+        if not os.path.exists(self.config.path):
+            raise StoreError(f"Path <{self.config.path}> does not exist")
+        self.path = self.config.path
+        self._catalog = None
+
+    def refresh(self):
+        """Forget the catalog, so that it is read again on next call
+        """
+        self._catalog = None
+
+    def list(self, filter: str = "") -> list[CommandFile]:
+        """Return the list of commands
+
+        Args:
+            filter (str, optional): name filter. Defaults to "".
+
+        Returns:
+            list[CommandFile]: list of command files
+        """
+        if self._catalog is None:
+            try:
+                self._catalog = commands.get_catalog(self.config.roots(), mirrored=self.config.mirror).items
+            except AssertionError as error:
+                raise StoreError(str(error)) from error
+        return [c for c in self._catalog if filter == "" or filter.lower() in c.f_name.lower()]
+
+    def find(self, name: str) -> CommandFile:
+        """Find a command by name
+        The name is either the file name, or the folder and file name (ex: folder/name)
+
+        Args:
+            name (str): command name
+
+        Raises:
+            StoreError: no command or several commands match
+
+        Returns:
+            CommandFile: command file
+        """
+        name = name.strip().strip("/")
+        found = [c for c in self.list() if c.f_name == name or f"{c.root_name.strip('/')}/{c.f_name}" == name]
+        if len(found) == 0:
+            raise StoreError(f"Unknown command <{name}>")
+        if len(found) > 1:
+            raise StoreError(f"Command <{name}> matches several commands")
+        return found[0]
+
+    def run(self,
+            command: Union[str, CommandFile],
+            params: Optional[dict[str, str]] = None,
+            capture: bool = False,
+            no_cache: bool = False,
+            busy: str = "wait",
+            wait_timeout: float = 0,
+            log: bool = False) -> RunResult:
+        """Run a command without any prompt
+        Missing params take their default value
+
+        Args:
+            command (str | CommandFile): command name or command file
+            params (dict[str, str], optional): param values. Defaults to None.
+            capture (bool, optional): if True, output is returned in result stdout and stderr instead of being
+                written to the process outputs. Defaults to False.
+            no_cache (bool, optional): if True, cached output is not used. Defaults to False.
+            busy (str, optional): wait, fail or skip when all run slots are used. Defaults to "wait".
+            wait_timeout (float, optional): maximum waiting time for a run slot, 0 for no limit. Defaults to 0.
+            log (bool, optional): if True, output is saved in a log. Defaults to False.
+
+        Raises:
+            StoreError: unknown command, missing param value, or command already running
+
+        Returns:
+            RunResult: exit code, start time, duration and captured output
+        """
+        cmd = command if isinstance(command, CommandFile) else self.find(command)
+        try:
+            cmd = commands.get_current(cmd, self.config.roots(), self.config.mirror)
+            values = runner.resolve(cmd, [], params or {}, store=self.path)
+            return runner.run(self.path, cmd, values, no_cache, busy, wait_timeout, log,
+                              capture=capture, passthrough=not capture)
+        except AssertionError as error:
+            raise StoreError(str(error)) from error
+
+
+class AsyncRun:
+    """AsyncRun object
+    A command running in an asyncio subprocess, with its own process group
+
+    Example:
+        async with await store.start("example", {"user": "Sebastien"}) as run:
+            async for line in run.stdout:
+                print(line.decode(), end="")
+            result = await run.wait()
+    """
+    cmd: CommandFile
+    process: asyncio.subprocess.Process
+    started: float
+
+    def __init__(self, cmd: CommandFile, process: asyncio.subprocess.Process, started: float,
+                 semaphore: asyncio.Semaphore, lock: Optional[CommandLock]):
+        self.cmd = cmd
+        self.process = process
+        self.started = started
+        self._semaphore = semaphore
+        self._lock = lock
+        self._queues = {"stdout": asyncio.Queue(), "stderr": asyncio.Queue()}
+        self._pumps = [asyncio.ensure_future(self._pump(process.stdout, self._queues["stdout"])),
+                       asyncio.ensure_future(self._pump(process.stderr, self._queues["stderr"]))]
+        self._timed_out = False
+        self._watchdog = asyncio.ensure_future(self._watch()) if cmd.timeout > 0 else None
+        self._result: Optional[RunResult] = None
+
+    async def _watch(self):
+        # #TIMEOUT is applied even if nobody waits for the script
+        try:
+            await asyncio.wait_for(asyncio.shield(self.process.wait()), self.cmd.timeout)
+        except asyncio.TimeoutError:
+            self._timed_out = True
+            await self.terminate()
+
+    @staticmethod
+    async def _pump(stream: asyncio.StreamReader, queue: asyncio.Queue):
+        # Pipes are always drained, so that an unread output never blocks the script
+        # Chunks are split into lines here: readline() fails on lines longer than the stream limit
+        pending: list[bytes] = []
+        try:
+            while True:
+                chunk = await stream.read(READ_CHUNK_SIZE)
+                if chunk == b"":
+                    break
+                if b"\n" not in chunk:
+                    pending.append(chunk)
+                    continue
+                lines = b"".join(pending + [chunk]).split(b"\n")
+                last = lines.pop()
+                pending = [last] if last != b"" else []
+                for line in lines:
+                    queue.put_nowait(line + b"\n")
+        finally:
+            if pending:
+                queue.put_nowait(b"".join(pending))
+            queue.put_nowait(b"")
+
+    @staticmethod
+    async def _lines(queue: asyncio.Queue) -> AsyncIterator[bytes]:
+        while True:
+            line = await queue.get()
+            if line == b"":
+                queue.put_nowait(b"")
+                return
+            yield line
+
+    @property
+    def stdout(self) -> AsyncIterator[bytes]:
+        """Lines written to stdout
+        """
+        return self._lines(self._queues["stdout"])
+
+    @property
+    def stderr(self) -> AsyncIterator[bytes]:
+        """Lines written to stderr
+        """
+        return self._lines(self._queues["stderr"])
+
+    async def terminate(self):
+        """Terminate the process group of the script, then kill it after a grace delay
+        """
+        if self.process.returncode is not None:
+            return
+        runner.kill(self.process, signal.SIGTERM)
+        try:
+            await asyncio.wait_for(self.process.wait(), TIMEOUT_GRACE)
+        except asyncio.TimeoutError:
+            runner.kill(self.process, signal.SIGKILL)
+            await self.process.wait()
+
+    async def wait(self) -> RunResult:
+        """Wait for the end of the script
+        When the waiting task is cancelled, the script is terminated
+
+        Returns:
+            RunResult: exit code, start time, duration and limit which stopped the script
+        """
+        if self._result is not None:
+            return self._result
+        try:
+            await asyncio.shield(self.process.wait())
+            await asyncio.gather(*self._pumps)
+            if self._watchdog is not None:
+                await self._watchdog
+        except asyncio.CancelledError:
+            await asyncio.shield(self.terminate())
+            raise
+        finally:
+            if self.process.returncode is not None:
+                self._release()
+        code, reason = runner.status(self.cmd, self.process.returncode, self._timed_out)
+        self._result = RunResult(code, self.started, time.time() - self.started, reason)
+        return self._result
+
+    async def close(self):
+        """Terminate the script if it is still running, and release its run slots
+        Used when the output is not read until the end
+        """
+        try:
+            await asyncio.shield(self.terminate())
+        finally:
+            await asyncio.shield(self.wait())
+
+    async def __aenter__(self) -> "AsyncRun":
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    def _release(self):
+        if self._lock is not None:
+            self._lock.release()
+            self._lock = None
+        if self._semaphore is not None:
+            self._semaphore.release()
+            self._semaphore = None
+
+
+class AsyncStore(Store):
+    """AsyncStore object
+    Runs commands with asyncio subprocesses, up to a maximum number of concurrent runs.
+    #CACHE and #LOG headers are not used by asyncio runs.
+
+    Example:
+        store = AsyncStore("DEFAULT", max_concurrent=8)
+        results = await asyncio.gather(*[store.run_async("report", {"day": d}) for d in days])
+    """
+    max_concurrent: int
+
+    def __init__(self, section: str = "DEFAULT", rcpath: str = "", max_concurrent: int = 8):
+        """Init class
+
+        Args:
+            section (str, optional): config section. Defaults to "DEFAULT".
+            rcpath (str, optional): config file path. Defaults to the user config file.
+            max_concurrent (int, optional): maximum number of concurrent runs. Defaults to 8.
+
+        Raises:
+            StoreError: the config section cannot be loaded
+        """
+        super().__init__(section, rcpath)
+        self.max_concurrent = max_concurrent
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loading: Optional[asyncio.Lock] = None
+
+    async def list_async(self, filter: str = "") -> list[CommandFile]:
+        """Return the list of commands
+        The catalog is read in a thread (store scan, overlays, mirror, git), so the event loop is not blocked
+
+        Args:
+            filter (str, optional): name filter. Defaults to "".
+
+        Returns:
+            list[CommandFile]: list of command files
+        """
+        if self._loading is None:
+            self._loading = asyncio.Lock()
+        async with self._loading:
+            # Concurrent first calls read the catalog once
+            if self._catalog is None:
+                await asyncio.get_running_loop().run_in_executor(None, self.list)
+        return self.list(filter)
+
+    async def start(self,
+                    command: Union[str, CommandFile],
+                    params: Optional[dict[str, str]] = None,
+                    busy: str = "wait") -> AsyncRun:
+        """Start a command, waiting for a free run slot first
+
+        Args:
+            command (str | CommandFile): command name or command file
+            params (dict[str, str], optional): param values. Defaults to None.
+            busy (str, optional): wait or fail when all #MAXCONCURRENT slots of the command are used.
+                Defaults to "wait".
+
+        Raises:
+            StoreError: unknown command, missing param value, or command already running
+
+        Returns:
+            AsyncRun: running command
+        """
+        if not isinstance(command, CommandFile):
+            await self.list_async()
+        cmd = command if isinstance(command, CommandFile) else self.find(command)
+
+        def prepare() -> tuple[CommandFile, list[str]]:
+            current = commands.get_current(cmd, self.config.roots(), self.config.mirror)
+            values = runner.resolve(current, [], params or {}, store=self.path)
+            current.extract()
+            return current, values
+
+        try:
+            # Dynamic defaults run commands, mirrored scripts are checked, and bundle scripts may be extracted
+            cmd, values = await asyncio.get_running_loop().run_in_executor(None, prepare)
+        except AssertionError as error:
+            raise StoreError(str(error)) from error
+
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        await self._semaphore.acquire()
+        lock = None
+        try:
+            if cmd.max_concurrent > 0:
+                lock = locks.try_acquire(self.path, cmd)
+                while lock is None:
+                    if busy != "wait":
+                        raise StoreError(f"Command <{cmd.f_name}> is already running")
+                    await asyncio.sleep(LOCK_POLL_DELAY)
+                    lock = locks.try_acquire(self.path, cmd)
+            started = time.time()
+            try:
+                process = await self._spawn(runner.command(cmd))
+            except OSError as error:
+                if error.errno != errno.ENOEXEC:
+                    raise
+                # No shebang: the script is run with sh
+                process = await self._spawn(runner.command(cmd, shell=True))
+        except BaseException:
+            if lock is not None:
+                lock.release()
+            self._semaphore.release()
+            raise
+        process.stdin.write("".join(map(lambda v: f"{v}\n", values)).encode())
+        try:
+            await process.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        process.stdin.close()
+        return AsyncRun(cmd, process, started, self._semaphore, lock)
+
+    @staticmethod
+    async def _spawn(args: list[str]) -> asyncio.subprocess.Process:
+        return await asyncio.create_subprocess_exec(*args,
+                                                    stdin=asyncio.subprocess.PIPE,
+                                                    stdout=asyncio.subprocess.PIPE,
+                                                    stderr=asyncio.subprocess.PIPE,
+                                                    start_new_session=True)
+
+    async def run_async(self,
+                        command: Union[str, CommandFile],
+                        params: Optional[dict[str, str]] = None,
+                        busy: str = "wait") -> RunResult:
+        """Run a command and return its captured output
+
+        Args:
+            command (str | CommandFile): command name or command file
+            params (dict[str, str], optional): param values. Defaults to None.
+            busy (str, optional): wait or fail when all #MAXCONCURRENT slots of the command are used.
+                Defaults to "wait".
+
+        Raises:
+            StoreError: unknown command, missing param value, or command already running
+
+        Returns:
+            RunResult: exit code, start time, duration and captured output
+        """
+        run = await self.start(command, params, busy)
+
+        async def collect(lines: AsyncIterator[bytes]) -> bytes:
+            return b"".join([line async for line in lines])
+
+        try:
+            stdout, stderr = await asyncio.gather(collect(run.stdout), collect(run.stderr))
+            result = await run.wait()
+        except asyncio.CancelledError:
+            await asyncio.shield(run.close())
+            raise
+        result.stdout = stdout
+        result.stderr = stderr
+        return result
@@ -21,7 +21,9 @@
 import os
 import sys
 import json
+import time
 import select
+from concurrent.futures import ThreadPoolExecutor
 
 import click
 from rich import print
@@ -29,20 +31,20 @@ from rich import print
 from .modules.ui import ui
 from .modules.git import git
 from .modules.params import params
+from .modules.shims import shims
+from .modules.runner import runner
+from .modules.dag import dag, DagStep
+from .modules.logs import logs
+from .modules.jobs import jobs, Job
+from .modules.scheduler import Scheduler
+from .modules.bundle import bundle
+from .modules.check import check
+from .modules.metrics import metrics
+from .modules.importer import importer, IMPORT_WORKERS
+from .modules.mirror import mirror
 from .modules.commands import commands, CommandFile
 
-from .appConfig import app, AppConfig
-
-
-class Config(AppConfig):
-    """Specific application config class
-    """
-    path: str = ""
-    usegit: bool = False
-    gitrepo: str = ""
-    gituser: str = ""
-    gitmail: str = ""
-    gitbranch: str = "main"
+from .appConfig import app, AppConfig, Config
 
 
 # RUN #################################################################################################################
@@ -71,6 +73,7 @@ def load_config(section: str, new_section: bool = False) -> Config:
     Returns:
         Config: config object
     """
+    started = time.time()
     config_file = app.default_rcpath()
     if not os.path.exists(config_file):
         config = create_config_file(config_file)
@@ -80,6 +83,8 @@ def load_config(section: str, new_section: bool = False) -> Config:
         AppConfig.add_section(config_file, section, Config(config_file))
     if not config.load(section):
         handle_error("Application cannot load config file")
+    if os.path.exists(config.path):
+        metrics.observe_config(config.path, time.time() - started)
     return config
 
 
@@ -127,6 +132,40 @@ def init_command(ctx, print_ui: bool = True) -> Config:
     return config
 
 
+def check_writable(config: Config):
+    """Check that the store can be modified
+
+    Args:
+        config (Config): config object
+    """
+    assert (not bundle.is_bundle(config.path)), f"Store <{config.path}> is a read-only bundle"
+
+
+def update_mirror(config: Config, paths: list[str]):
+    """Update the local mirror after command files were written in the store
+
+    Args:
+        config (Config): config object
+        paths (list[str]): created, modified or deleted file paths
+    """
+    if config.mirror:
+        mirror.update(config.path, paths)
+
+
+def check_command(config: Config, paths: list[str]):
+    """Check command files before commit, errors are displayed
+
+    Args:
+        config (Config): config object
+        paths (list[str]): command file paths
+    """
+    results = check.run(config.path, list(map(lambda p: CommandFile(config.path, p), paths)))
+    failed = [r for r in results if not r.ok]
+    if len(failed) > 0:
+        ui.show_checks(failed)
+    assert (len(failed) == 0), f"{len(failed)} command file(s) with errors, not committed"
+
+
 # GLOBAL ##############################################################################################################
 
 def handle_success(message: str):
@@ -168,7 +207,7 @@ def complete_store(ctx, param, incomplete):
 def complete_filter(ctx, param, incomplete):
     store = ctx.parent.params["context"]
     config: Config = init_context(store)
-    items = commands.get_list(config.path, incomplete)
+    items = commands.get_catalog(config.roots(), incomplete, mirrored=config.mirror).items
     return list(map(lambda i: f"\"{i.f_name}\"", items))
 
 
@@ -182,37 +221,101 @@ def run_command(ctx, cmd: CommandFile, **kwargs):
         ctx (_type_): context
         cmd (CommandFile): command details
     """
+    config: Config = ctx.obj["config"]
     stdin_values = []
     if select.select([sys.stdin, ], [], [], 0.0)[0]:
         for line in sys.stdin:
             stdin_values.append(line.removesuffix("\n"))
 
     try:
-        if len(cmd.params) == 0:
-            values_str = ""
+        cmd = commands.get_current(cmd, config.roots(), config.mirror)
+        values = runner.resolve(cmd, stdin_values, kwargs, lambda p, d: ui.ask(p.message, d), config.path)
+        if ctx.obj["with_deps"]:
+            run_steps(ctx, cmd, values)
+            return
+        result = runner.run(config.path, cmd, values, ctx.obj["no_cache"], ctx.obj["busy"], ctx.obj["wait_timeout"],
+                            ctx.obj["log"])
+        if result.skipped:
+            handle_success(f"Command <{cmd.f_name}> is already running, skipped")
+        if result.reason != "":
+            ui.print_error(f"Command stopped by {result.reason} (exit code {result.code})", must_exit=False)
+    except Exception as error:
+        handle_error(error)
+    if result.code != 0:
+        exit(result.code)
+
+
+def run_steps(ctx, cmd: CommandFile, values: list[str]):
+    """Run a command after its dependencies
+
+    Args:
+        ctx (_type_): context
+        cmd (CommandFile): command details
+        values (list[str]): command parameter values
+    """
+    config: Config = ctx.obj["config"]
+    steps = dag.build(get_commands(ctx), cmd)
+    for step in steps:
+        # All values are prompted before starting
+        if step.cmd == cmd:
+            step.values = values
         else:
-            values_str = "("
-            index = 0
-            for param in cmd.params:
-                value = ""
-                if index < len(stdin_values):
-                    value = stdin_values[index]
-                index += 1
-                if value == "" and param.name in kwargs.keys():
-                    value = kwargs[param.name]
-                    if value == param.default and param.ask_always:
-                        value = ui.ask(param.message, param.default)
-                if value == "":
-                    value = ui.ask(param.message, param.default)
-                assert (value != ""), f"Value for <{param.name}> must not be empty"
-                values_str += f"echo \"{value}\"; "
-            values_str = values_str.removesuffix("; ")
-            values_str += ") | "
-        os.system(f"{values_str}{cmd.path}")
+            step.cmd = commands.get_current(step.cmd, config.roots(), config.mirror)
+            step.values = runner.resolve(step.cmd, [], {},
+                                         lambda p, d: ui.ask(f"{step.cmd.f_name}: {p.message}", d), config.path)
+
+    def run_step(step: DagStep):
+        return runner.run(config.path, step.cmd, step.values,
+                          ctx.obj["no_cache"], ctx.obj["busy"], ctx.obj["wait_timeout"], ctx.obj["log"])
+
+    started = time.time()
+    dag.execute(steps, ctx.obj["jobs"], run_step)
+    critical = dag.critical_path(steps)
+    print("")
+    ui.show_steps(steps, critical)
+    critical_duration = sum(map(lambda s: s.result.duration, critical))
+    handle_success(f"Critical path: {' > '.join(map(lambda s: s.cmd.f_name, critical))} "
+                   f"({critical_duration:.2f}s), total {time.time() - started:.2f}s")
+    failed = [s for s in steps if s.status == "failed"]
+    if len(failed) > 0:
+        exit(failed[0].result.code if failed[0].result is not None else 2)
+
+
+@click.pass_context
+def submit_command(ctx, cmd: CommandFile, **kwargs):
+    """Add a specific command to the job queue
+
+    Args:
+        ctx (_type_): context
+        cmd (CommandFile): command details
+    """
+    config: Config = ctx.obj["config"]
+    stdin_values = []
+    if select.select([sys.stdin, ], [], [], 0.0)[0]:
+        for line in sys.stdin:
+            stdin_values.append(line.removesuffix("\n"))
+
+    try:
+        cmd = commands.get_current(cmd, config.roots(), config.mirror)
+        values = runner.resolve(cmd, stdin_values, kwargs, lambda p, d: ui.ask(p.message, d), config.path)
+        job_id = jobs.submit(config.path, cmd, values)
+        handle_success(f"Job {job_id} submitted")
     except Exception as error:
         handle_error(error)
 
 
+def submit(cmd: CommandFile):
+    """Helper to submit a command
+
+    Args:
+        cmd (CommandFile): command
+
+    Returns:
+        lambda: callback function for command
+    """
+    return lambda **kwargs: submit_command(cmd, **kwargs)
+
+
 def run(cmd: CommandFile):
     """Helper to run a command
 
@@ -225,6 +328,58 @@ def run(cmd: CommandFile):
     return lambda **kwargs: run_command(cmd, **kwargs)
 
 
+def get_commands(ctx, filter: str = "") -> list[CommandFile]:
+    """Return the command files of the store
+    The full list is only read once per invocation
+
+    Args:
+        ctx (_type_): context
+        filter (str, optional): name filter. Defaults to "".
+
+    Returns:
+        list[CommandFile]: list of command files
+    """
+    config: Config = ctx.obj["config"]
+    if filter != "":
+        return commands.get_catalog(config.roots(), filter, mirrored=config.mirror).items
+    if "commands" not in ctx.obj:
+        ctx.obj["commands"] = commands.get_catalog(config.roots(), mirrored=config.mirror).items
+    return ctx.obj["commands"]
+
+
+class CommandGroup(click.Group):
+    """Class used by click groups whose subcommands are the command files
+    Command files are read on first use. A name with a folder (ex: ops/db/backup) only reads this folder.
+    """
+    def __init__(self, *args, helper=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.helper = helper
+        self.loaded = False
+
+    def add_file(self, cmd: CommandFile, name: str) -> click.Command:
+        params = []
+        for param in cmd.params:
+            params.append(click.Option([f"--{param.name}"], help=param.message, default=param.default))
+        command = click.Command(name, params=params, callback=self.helper(cmd), help=cmd.desc)
+        self.add_command(command)
+        return command
+
+    def list_commands(self, ctx):
+        if not self.loaded:
+            self.loaded = True
+            for cmd in get_commands(ctx):
+                self.add_file(cmd, cmd.f_name)
+        return super().list_commands(ctx)
+
+    def get_command(self, ctx, cmd_name):
+        if "/" in cmd_name.strip("/"):
+            key = cmd_name.strip("/").lower()
+            matches = [c for c in get_commands(ctx, cmd_name) if commands.key(c).lower() == key]
+            return self.add_file(matches[0], cmd_name) if len(matches) > 0 else None
+        self.list_commands(ctx)
+        return super().get_command(ctx, cmd_name)
+
+
 @click.group()
 @click.pass_context
 @click.version_option(app.version())
@@ -235,23 +390,118 @@ def cli(ctx, context):
     """
     ctx.obj["context"] = context
     config: Config = init_command(ctx, False)
-    cmds = commands.get_list(config.path)
-    for cmd in cmds:
-        params = []
-        for param in cmd.params:
-            params.append(click.Option([f"--{param.name}"], help=param.message, default=param.default))
-        cli_run.add_command(click.Command(cmd.f_name, params=params, callback=run(cmd), help=cmd.desc))
+    ctx.obj["config"] = config
     pass
 
 
-@cli.group("run")
+@cli.group("run", cls=CommandGroup, helper=run)
 @click.pass_context
-def cli_run(ctx: click.Context):
+@click.option("--no-cache", is_flag=True, help="Run #CACHE commands even if a cached output exists")
+@click.option("--busy", type=click.Choice(["wait", "fail", "skip"]), default="wait",
+              help="Action when #LOCK or #MAXCONCURRENT commands are already running (default is wait)")
+@click.option("--wait-timeout", type=float, default=0, help="Maximum waiting time in seconds (default is no limit)")
+@click.option("--with-deps", is_flag=True, help="Run #DEPENDS commands first")
+@click.option("-j", "--jobs", type=int, default=1, help="Maximum number of parallel commands with --with-deps")
+@click.option("--log", is_flag=True, help="Save output in a log, as with #LOG header")
+def cli_run(ctx: click.Context, no_cache: bool, busy: str, wait_timeout: float, with_deps: bool, jobs: int,
+            log: bool):
     """Run command
     """
+    ctx.obj["log"] = log
+    ctx.obj["with_deps"] = with_deps
+    ctx.obj["jobs"] = jobs
+    ctx.obj["no_cache"] = no_cache
+    ctx.obj["busy"] = busy
+    ctx.obj["wait_timeout"] = wait_timeout
+
+
+@cli.group("submit", cls=CommandGroup, helper=submit)
+@click.pass_context
+def cli_submit(ctx: click.Context):
+    """Add command to the job queue
+    """
     pass
 
 
+@cli.command("worker")
+@click.pass_context
+@click.option("-j", "--jobs", "threads", type=int, default=1, help="Number of jobs run in parallel (default is 1)")
+@click.option("--once", is_flag=True, help="Stop when the queue is empty")
+@click.option("--log", is_flag=True, help="Save output of all jobs in logs")
+def cli_worker(ctx: click.Context, threads: int, once: bool, log: bool):
+    """Run jobs from the job queue
+    """
+    config: Config = init_command(ctx, False)
+
+    def run_job(job: Job) -> int:
+        assert (os.path.exists(job.path)), f"Command file <{job.path}> does not exist"
+        cmd = CommandFile(config.path, job.path)
+        if job.root_name != "":
+            # Logs, locks and metrics use the same name as a run of the command
+            cmd.root_name = job.root_name
+        return runner.run(config.path, cmd, job.values, log=log).code
+
+    try:
+        recovered = jobs.recover(config.path)
+        if recovered > 0:
+            handle_success(f"{recovered} interrupted jobs requeued")
+        jobs.work(config.path, run_job, threads, once)
+    except Exception as error:
+        handle_error(error)
+
+
+@cli.command("jobs")
+@click.pass_context
+@click.option("--status", type=click.Choice(["queued", "running", "done", "failed"]), default=None,
+              help="Show only jobs with this status")
+@click.option("-n", "--number", type=int, default=20, help="Number of jobs displayed (default is 20)")
+def cli_jobs(ctx: click.Context, status: str, number: int):
+    """Show the job queue
+    """
+    config: Config = init_command(ctx, False)
+    try:
+        items = jobs.get_list(config.path, status or "", number)
+        handle_data(items, ui.show_jobs)
+        stats = jobs.stats(config.path)
+        handle_success(f"Queue: {stats['queued']} queued, {stats['running']} running, {stats['done']} done, "
+                       f"{stats['failed']} failed")
+        handle_success(f"Last hour: {stats['finished']} finished ({stats['finished_failed']} failed), "
+                       f"average duration {stats['duration']:.2f}s")
+    except Exception as error:
+        handle_error(error)
+
+
+@cli.command("scheduler")
+@click.pass_context
+@click.option("--overlap", type=click.Choice(["skip", "queue", "parallel"]), default="skip",
+              help="Action when a command is still running at its next run (default is skip)")
+@click.option("--catch-up", type=click.Choice(["none", "once", "all"]), default="none",
+              help="Runs missed while the scheduler was stopped (default is none)")
+@click.option("--reload", "reload_delay", type=float, default=30,
+              help="Delay between checks of command changes in seconds (default is 30)")
+@click.option("--log", is_flag=True, help="Save output of all runs in logs")
+def cli_scheduler(ctx: click.Context, overlap: str, catch_up: str, reload_delay: float, log: bool):
+    """Run #SCHEDULE commands
+    """
+    config: Config = init_command(ctx, False)
+
+    def run_scheduled(cmd: CommandFile) -> int:
+        cmd = commands.get_current(cmd, config.roots(), config.mirror)
+        values = runner.resolve(cmd, [], {}, store=config.path)
+        return runner.run(config.path, cmd, values, log=log).code
+
+    try:
+        scheduler = Scheduler(config.path, run_scheduled, overlap, catch_up, reload_delay, config.roots(),
+                              config.mirror)
+        scheduler.reload()
+        handle_success(f"Scheduler started with {len(scheduler.items)} commands")
+        scheduler.loop()
+    except KeyboardInterrupt:
+        handle_success("Scheduler stopped")
+    except Exception as error:
+        handle_error(error)
+
+
 # INITIALISATION ######################################################################################################
 
 @cli.command("init")
@@ -302,6 +552,8 @@ def cli_init_git(ctx, repo: str, user: str, mail: str, branch: str, pull: bool):
             f.write("*.sh diff=sh")
             f.close()
         git.init(config.path, config.gitrepo, config.gitbranch, config.gituser, config.gitmail, pull)
+        if pull:
+            commands.update_index(config.path)
         handle_success("Git initialized")
     except Exception as error:
         handle_error(error)
@@ -312,14 +564,20 @@ def cli_init_git(ctx, repo: str, user: str, mail: str, branch: str, pull: bool):
 @cli.command("list")
 @click.pass_context
 @click.argument("filter", default="", shell_complete=complete_filter)
-def cli_list(ctx, filter: str):
+@click.option("--show-shadowed", is_flag=True, help="Show commands hidden by a command with the same name")
+def cli_list(ctx, filter: str, show_shadowed: bool):
     """List commands
     """
     config: Config = init_command(ctx)
     try:
-        items = commands.get_list(config.path, filter)
-        handle_data(items, ui.show_commands)
-        handle_success(config.path)
+        catalog = commands.get_catalog(config.roots(), filter, mirrored=config.mirror)
+        handle_data(catalog.items, ui.show_commands)
+        if show_shadowed:
+            print("")
+            handle_data(catalog.shadowed, ui.show_shadowed)
+        for root, reason in catalog.skipped.items():
+            print(f"[yellow italic]WARNING: {root} skipped, {reason}[/]")
+        handle_success(os.pathsep.join(config.roots()))
     except Exception as error:
         handle_error(error)
 
@@ -332,10 +590,14 @@ def cli_edit(ctx, filter: str):
     """
     config: Config = init_command(ctx)
     try:
+        check_writable(config)
+        # Overlays are read-only: only commands of the store itself can be modified
         items = commands.get_list(config.path, filter)
         cmd = params.validate_command(items)
         click.edit(filename=cmd.path)
+        update_mirror(config, [cmd.path])
         if config.usegit:
+            check_command(config, [cmd.path])
             git.commit(config.path, f"Update command file <{cmd.f_name}>", config.gitbranch)
         handle_success("File edited")
     except Exception as error:
@@ -344,44 +606,220 @@ def cli_edit(ctx, filter: str):
 
 @cli.command("new")
 @click.pass_context
-@click.option("--name", default="", help="Command name")
+@click.option("--name", help="Command name (several names to create several commands)", multiple=True)
 @click.option("--desc", default="", help="Command description")
 @click.option("--param", help="Command param", multiple=True)
-def cli_new(ctx, name: str, desc: str, param: list[str]):
+def cli_new(ctx, name: list[str], desc: str, param: list[str]):
     """New command
     """
     config: Config = init_command(ctx)
     try:
-        name = params.validate(name, "Command name")
-        new_path = os.path.join(config.path, f"{name}.sh")
-        assert (not os.path.exists(new_path)), "File already exists"
+        check_writable(config)
+        names = list(name) if len(name) > 0 else [params.validate("", "Command name")]
+        new_paths = list(map(lambda n: os.path.join(config.path, f"{n.strip()}.sh"), names))
+        for new_path in new_paths:
+            assert (not os.path.exists(new_path)), f"File <{new_path}> already exists"
         desc = params.validate(desc, "Command description")
-        commands.create(new_path, desc, param)
+        with ThreadPoolExecutor(max_workers=IMPORT_WORKERS) as pool:
+            list(pool.map(lambda p: commands.create(p, desc, param), new_paths))
+        update_mirror(config, new_paths)
         if config.usegit:
-            git.commit(config.path, f"Create command file <{name}>", config.gitbranch)
-        handle_success("File created")
+            check_command(config, new_paths)
+            git.commit(config.path, f"Create command file <{', '.join(names)}>", config.gitbranch)
+        handle_success("File created" if len(names) == 1 else f"{len(names)} files created")
     except Exception as error:
         handle_error(error)
 
 
 @cli.command("delete")
 @click.pass_context
-@click.argument("filter", default="", shell_complete=complete_filter)
-def cli_delete(ctx, filter: str):
-    """Delete command
+@click.argument("filter", nargs=-1, shell_complete=complete_filter)
+def cli_delete(ctx, filter: list[str]):
+    """Delete command (several filters to delete several commands)
     """
     config: Config = init_command(ctx)
     try:
-        items = commands.get_list(config.path, filter)
-        cmd = params.validate_command(items)
+        check_writable(config)
+        cmds: list[CommandFile] = []
+        for f in filter if len(filter) > 0 else [""]:
+            # Overlays are read-only: only commands of the store itself can be modified
+            items = commands.get_list(config.path, f)
+            cmd = params.validate_command(items)
+            if cmd.path not in map(lambda c: c.path, cmds):
+                cmds.append(cmd)
         # CONFIRM DELETION
-        confirmed = ui.confirm("Delete command file")
+        if len(cmds) > 1:
+            ui.show_commands(cmds)
+        confirmed = ui.confirm("Delete command file" if len(cmds) == 1 else f"Delete {len(cmds)} command files")
         assert (confirmed), "Command deletion has been cancelled"
         # DELETE
-        os.remove(cmd.path)
+        with ThreadPoolExecutor(max_workers=IMPORT_WORKERS) as pool:
+            list(pool.map(lambda c: os.remove(c.path), cmds))
+        update_mirror(config, list(map(lambda c: c.path, cmds)))
         if config.usegit:
-            git.commit(config.path, f"Delete command file <{cmd.f_name}>", config.gitbranch)
-        handle_success("File deleted")
+            git.commit(config.path, f"Delete command file <{', '.join(map(lambda c: c.f_name, cmds))}>",
+                       config.gitbranch)
+        handle_success("File deleted" if len(cmds) == 1 else f"{len(cmds)} files deleted")
+    except Exception as error:
+        handle_error(error)
+
+
+@cli.command("import")
+@click.pass_context
+@click.argument("source", type=click.Path(exists=True, file_okay=False))
+@click.option("--force", is_flag=True, help="Replace existing command files")
+def cli_import(ctx, source: str, force: bool):
+    """Import all scripts of a directory, adding missing headers
+    """
+    config: Config = init_command(ctx)
+    try:
+        check_writable(config)
+        imported, skipped = importer.run(source, config.path, force)
+        update_mirror(config, imported)
+        for path in skipped:
+            print(f"[yellow italic]WARNING: {path} already exists, skipped[/]")
+        if config.usegit and len(imported) > 0:
+            check_command(config, imported)
+            git.commit(config.path, f"Import {len(imported)} command files from <{os.path.basename(source)}>",
+                       config.gitbranch)
+        handle_success(f"{len(imported)} files imported, {len(skipped)} skipped")
+    except Exception as error:
+        handle_error(error)
+
+
+@cli.command("logs")
+@click.pass_context
+@click.argument("filter", default="", shell_complete=complete_filter)
+@click.option("-n", "--number", type=int, default=10, help="Number of runs displayed (default is 10)")
+@click.option("--show", type=int, default=0, help="Print the output of a run (1 is the most recent)")
+def cli_logs(ctx, filter: str, number: int, show: int):
+    """Show logs of command runs
+    """
+    config: Config = init_command(ctx)
+    try:
+        items = commands.get_catalog(config.roots(), filter, mirrored=config.mirror).items
+        cmd = params.validate_command(items)
+        runs = logs.get_list(config.path, cmd)
+        if show > 0:
+            assert (show <= len(runs)), f"Run <{show}> does not exist"
+            logs.read(runs[show - 1], sys.stdout.buffer)
+        else:
+            handle_data(runs[:number], ui.show_logs)
+            handle_success(f"{len(runs)} logs")
+    except Exception as error:
+        handle_error(error)
+
+
+@cli.command("pack")
+@click.pass_context
+@click.argument("output")
+def cli_pack(ctx, output: str):
+    """Pack all commands in a read-only bundle file
+    """
+    config: Config = init_command(ctx, False)
+    try:
+        check_writable(config)
+        items = commands.get_catalog(config.roots(), mirrored=config.mirror).items
+        count = bundle.pack(output, items)
+        handle_success(f"{count} commands packed in {output}")
+    except Exception as error:
+        handle_error(error)
+
+
+@cli.command("shims")
+@click.pass_context
+@click.option("--install", "bindir", required=True, help="Directory where the shims are installed")
+@click.option("--prefix", default="", help="Prefix added to each shim name")
+def cli_shims(ctx, bindir: str, prefix: str):
+    """Install bash shims running commands without pbash
+    """
+    config: Config = init_command(ctx)
+    try:
+        items = commands.get_catalog(config.roots(), mirrored=config.mirror).items
+        written, unchanged, removed = shims.install(items, bindir, prefix, recup_context(ctx))
+        handle_success(f"Shims installed in {bindir} ({written} written, {unchanged} unchanged, {removed} removed)")
+    except Exception as error:
+        handle_error(error)
+
+
+@cli.command("check")
+@click.pass_context
+@click.argument("filter", default="", shell_complete=complete_filter)
+@click.option("--json", "as_json", is_flag=True, help="Print results in JSON format")
+@click.option("-j", "--jobs", type=int, default=None, help="Number of processes (default is the number of cpus)")
+def cli_check(ctx, filter: str, as_json: bool, jobs: int):
+    """Check syntax and headers of commands
+    """
+    config: Config = init_command(ctx, False)
+    try:
+        roots = config.roots()
+        catalog = commands.get_catalog(roots, mirrored=config.mirror).items
+        items = catalog if filter == "" else commands.get_catalog(roots, filter, mirrored=config.mirror).items
+        results = check.run(config.path, items, jobs, filter == "", catalog)
+        failed = [r for r in results if not r.ok]
+        if as_json:
+            click.echo(json.dumps(list(map(lambda r: r.to_json(), results)), indent=2))
+        else:
+            if len(failed) > 0:
+                handle_data(failed, ui.show_checks)
+            cached = len([r for r in results if r.cached])
+            handle_success(f"{len(results)} commands checked ({cached} cached), {len(failed)} with errors")
+    except Exception as error:
+        handle_error(error)
+    if len(failed) > 0:
+        exit(1)
+
+
+# METRICS #############################################################################################################
+
+@cli.group("metrics")
+@click.pass_context
+def cli_metrics(ctx):
+    """Export run and scan metrics
+    """
+    pass
+
+
+@cli_metrics.command("show")
+@click.pass_context
+@click.option("--prometheus", is_flag=True, help="Prometheus text format instead of OpenMetrics")
+def cli_metrics_show(ctx, prometheus: bool):
+    """Print metrics in OpenMetrics format
+    """
+    config: Config = init_command(ctx, False)
+    try:
+        click.echo(metrics.render(metrics.load(config.path), not prometheus), nl=False)
+    except Exception as error:
+        handle_error(error)
+
+
+@cli_metrics.command("textfile")
+@click.pass_context
+@click.argument("path", default="")
+def cli_metrics_textfile(ctx, path: str):
+    """Write metrics to a node exporter textfile after each update (no path to disable)
+    """
+    config: Config = init_command(ctx, False)
+    try:
+        metrics.set_textfile(config.path, path)
+        handle_success(f"Metrics written to {path}" if path != "" else "Metrics textfile disabled")
+    except Exception as error:
+        handle_error(error)
+
+
+@cli_metrics.command("serve")
+@click.pass_context
+@click.option("--bind", default="127.0.0.1", help="Listening address (default is 127.0.0.1)")
+@click.option("--port", type=int, default=9464, help="Listening port (default is 9464)")
+def cli_metrics_serve(ctx, bind: str, port: int):
+    """Serve metrics over HTTP, until interrupted
+    """
+    config: Config = init_command(ctx, False)
+    try:
+        handle_success(f"Serving metrics on http://{bind}:{port}/metrics")
+        metrics.serve(config.path, bind, port)
+    except KeyboardInterrupt:
+        handle_success("Metrics server stopped")
     except Exception as error:
         handle_error(error)
 
@@ -416,6 +854,8 @@ def cli_git_pull(ctx: click.Context):
     config = init_command(ctx)
     try:
         git.pull(config.path, config.gitbranch)
+        # Only the files changed by the pull are parsed
+        commands.update_index(config.path)
     except Exception as error:
         handle_error(error)
 
@@ -440,5 +880,6 @@ def cli_git_sync(ctx: click.Context):
     config = init_command(ctx)
     try:
         git.sync(config.path, config.gitbranch)
+        commands.update_index(config.path)
     except Exception as error:
         handle_error(error)
@@ -18,6 +18,7 @@
 """Utils for application configuration
 """
 
+import io
 import os
 import configparser
 import pkg_resources
@@ -26,6 +27,8 @@ from pathlib import Path
 
 import click
 
+from .modules.fileio import fileio
+
 
 class AppConfig:
     """Base application configuration class
@@ -52,12 +55,14 @@ class AppConfig:
         try:
             if not os.path.exists(self.__filepath__):
                 return False
-            cfg = configparser.ConfigParser()
-            cfg.read(self.__filepath__)
+            cfg = AppConfig.read(self.__filepath__)
             if (section not in cfg.sections()) and (section != cfg.default_section):
                 return False
             members = [attr for attr in dir(self) if not callable(getattr(self, attr)) and not attr.startswith("__")]
             for member in members:
+                if member not in cfg[section]:
+                    # Keep default value for options added after the file creation
+                    continue
                 if isinstance(getattr(self, member), str):
                     setattr(self, member, cfg[section][member])
                 elif isinstance(getattr(self, member), bool):
@@ -72,13 +77,16 @@ class AppConfig:
         Args:
             section (str, optional): section of config file. Defaults to "DEFAULT".
         """
-        cfg = configparser.ConfigParser()
-        members = [attr for attr in dir(self) if not callable(getattr(self, attr)) and not attr.startswith("__")]
-        for member in members:
-            cfg[section][member] = str(getattr(self, member))
-        with open(self.__filepath__, "w") as configfile:
-            cfg.write(configfile)
-            configfile.close()
+        with fileio.lock(self.__filepath__):
+            # Sections written by a concurrent process are kept
+            cfg = configparser.ConfigParser()
+            cfg.read(self.__filepath__)
+            if section not in cfg and section != cfg.default_section:
+                cfg.add_section(section)
+            members = [attr for attr in dir(self) if not callable(getattr(self, attr)) and not attr.startswith("__")]
+            for member in members:
+                cfg[section][member] = str(getattr(self, member))
+            AppConfig.write(self.__filepath__, cfg)
 
     def save(self, section: str):
         """Save config file
@@ -86,14 +94,40 @@ class AppConfig:
         Args:
             section (str): section of config file
         """
+        with fileio.lock(self.__filepath__):
+            cfg = configparser.ConfigParser()
+            cfg.read(self.__filepath__)
+            members = [attr for attr in dir(self) if not callable(getattr(self, attr)) and not attr.startswith("__")]
+            for member in members:
+                cfg[section][member] = str(getattr(self, member))
+            AppConfig.write(self.__filepath__, cfg)
+
+    @staticmethod
+    def read(filepath: str) -> configparser.ConfigParser:
+        """Read config file, with a shared lock
+
+        Args:
+            filepath (str): config file path
+
+        Returns:
+            configparser.ConfigParser: config content
+        """
         cfg = configparser.ConfigParser()
-        cfg.read(self.__filepath__)
-        members = [attr for attr in dir(self) if not callable(getattr(self, attr)) and not attr.startswith("__")]
-        for member in members:
-            cfg[section][member] = str(getattr(self, member))
-        with open(self.__filepath__, "w") as configfile:
-            cfg.write(configfile)
-            configfile.close()
+        with fileio.lock(filepath, shared=True):
+            cfg.read(filepath)
+        return cfg
+
+    @staticmethod
+    def write(filepath: str, cfg: configparser.ConfigParser):
+        """Write config file atomically, the caller holds the exclusive lock
+
+        Args:
+            filepath (str): config file path
+            cfg (configparser.ConfigParser): config content
+        """
+        content = io.StringIO()
+        cfg.write(content)
+        fileio.write(filepath, content.getvalue())
 
     @staticmethod
     def add_section(filepath: str, section: str, item):
@@ -105,16 +139,15 @@ class AppConfig:
             section (str): section of config file
             item: AppConfig extended class
         """
-        cfg = configparser.ConfigParser()
-        cfg.read(filepath)
-        assert (section not in cfg.sections()), f"Section <{section}> already exists"
-        cfg.add_section(section)
-        members = [attr for attr in dir(item) if not callable(getattr(item, attr)) and not attr.startswith("__")]
-        for member in members:
-            cfg[section][member] = str(getattr(item, member))
-        with open(filepath, "w") as configfile:
-            cfg.write(configfile)
-            configfile.close()
+        with fileio.lock(filepath):
+            cfg = configparser.ConfigParser()
+            cfg.read(filepath)
+            assert (section not in cfg.sections()), f"Section <{section}> already exists"
+            cfg.add_section(section)
+            members = [attr for attr in dir(item) if not callable(getattr(item, attr)) and not attr.startswith("__")]
+            for member in members:
+                cfg[section][member] = str(getattr(item, member))
+            AppConfig.write(filepath, cfg)
 
     @staticmethod
     def get_sections(filepath: str) -> list[str]:
@@ -126,9 +159,29 @@ class AppConfig:
         Returns:
             list(str): List of section names
         """
-        cfg = configparser.ConfigParser()
-        cfg.read(filepath)
-        return cfg.sections()
+        return AppConfig.read(filepath).sections()
+
+
+class Config(AppConfig):
+    """Specific application config class
+    """
+    path: str = ""
+    usegit: bool = False
+    gitrepo: str = ""
+    gituser: str = ""
+    gitmail: str = ""
+    gitbranch: str = "main"
+    overlays: str = ""
+    mirror: bool = False
+
+    def roots(self) -> list[str]:
+        """Return the store path followed by overlay paths, highest priority first
+
+        Returns:
+            list[str]: list of paths
+        """
+        overlays = [p.strip() for p in self.overlays.split(os.pathsep) if p.strip() != ""]
+        return [self.path] + overlays
 
 
 class AliasedGroup(click.Group):
@@ -0,0 +1,149 @@
+# Copyright (C) 2022 Sebastien Guerri
+#
+# This file is part of pbash.
+#
+# pbash is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# pbash is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Handle read-only store bundles
+"""
+
+import os
+import json
+import mmap
+import stat
+import struct
+import hashlib
+import tempfile
+
+from .state import state
+
+
+BUNDLE_MAGIC = b"PBASHPK1"
+BUNDLE_HEADER = struct.Struct("<8sQ")
+
+
+class bundle:
+    """Static class for store bundles
+    A bundle is made of a header, a JSON index with all parsed command headers, then all script contents
+    """
+
+    @staticmethod
+    def is_bundle(path: str) -> bool:
+        """Check if a store path is a bundle
+
+        Args:
+            path (str): store path
+
+        Returns:
+            bool: True if the path is a bundle file
+        """
+        return os.path.isfile(path)
+
+    @staticmethod
+    def pack(output: str, items: list) -> int:
+        """Write a bundle file
+
+        Args:
+            output (str): bundle file path
+            items (list[CommandFile]): list of command files
+
+        Returns:
+            int: number of packed commands
+        """
+        entries = []
+        contents = []
+        offset = 0
+        for cmd in items:
+            with open(cmd.path, "rb") as f:
+                content = f.read()
+            entry = cmd.to_json()
+            del entry["path"]
+            entry["rel"] = os.path.join(cmd.root_name.strip("/"), cmd.f)
+            entry["sha256"] = hashlib.sha256(content).hexdigest()
+            entry["offset"] = offset
+            entry["length"] = len(content)
+            entries.append(entry)
+            contents.append(content)
+            offset += len(content)
+        index = json.dumps({"entries": entries}).encode()
+        tmp_path = f"{output}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(BUNDLE_HEADER.pack(BUNDLE_MAGIC, len(index)))
+            f.write(index)
+            for content in contents:
+                f.write(content)
+        os.replace(tmp_path, output)
+        return len(entries)
+
+    @staticmethod
+    def read_index(path: str) -> list[dict]:
+        """Read the index of a bundle, without reading script contents
+
+        Args:
+            path (str): bundle file path
+
+        Returns:
+            list[dict]: index entries
+        """
+        with open(path, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                assert (len(data) >= BUNDLE_HEADER.size), f"File <{path}> is not a pbash bundle"
+                magic, size = BUNDLE_HEADER.unpack_from(data, 0)
+                assert (magic == BUNDLE_MAGIC), f"File <{path}> is not a pbash bundle"
+                return json.loads(data[BUNDLE_HEADER.size:BUNDLE_HEADER.size + size])["entries"]
+
+    @staticmethod
+    def script_path(sha256: str, name: str) -> str:
+        """Return the path of an extracted script
+
+        Args:
+            sha256 (str): script content hash
+            name (str): script file name
+
+        Returns:
+            str: extracted script path
+        """
+        return state.cache_path("scripts", sha256, name)
+
+    @staticmethod
+    def extract(path: str, sha256: str, name: str) -> str:
+        """Extract a script from a bundle, if not already extracted
+
+        Args:
+            path (str): bundle file path
+            sha256 (str): script content hash
+            name (str): script file name
+
+        Returns:
+            str: extracted script path
+        """
+        script_path = bundle.script_path(sha256, name)
+        if os.path.exists(script_path):
+            return script_path
+        entries = [e for e in bundle.read_index(path) if e["sha256"] == sha256]
+        assert (len(entries) != 0), f"Script <{sha256}> not found in bundle <{path}>"
+        with open(path, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                _, size = BUNDLE_HEADER.unpack_from(data, 0)
+                start = BUNDLE_HEADER.size + size + entries[0]["offset"]
+                content = data[start:start + entries[0]["length"]]
+        assert (hashlib.sha256(content).hexdigest() == sha256), f"Bundle <{path}> is corrupted"
+        os.makedirs(os.path.dirname(script_path), exist_ok=True)
+        # Unique per extraction: the same script may be extracted by several threads of a process
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(script_path), prefix=f"{name}.", suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        os.chmod(tmp_path, stat.S_IRWXU | stat.S_IRGRP | stat.S_IXGRP | stat.S_IROTH | stat.S_IXOTH)
+        os.replace(tmp_path, script_path)
+        return script_path
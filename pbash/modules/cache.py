@@ -0,0 +1,169 @@
+# Copyright (C) 2022 Sebastien Guerri
+#
+# This file is part of pbash.
+#
+# pbash is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# pbash is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Handle command output cache
+"""
+
+import os
+import time
+import hashlib
+import tempfile
+
+from typing import BinaryIO
+
+from .commands import CommandFile
+from .state import state
+
+
+CACHE_MAX_SIZE = 64 * 1024 ** 2
+CACHE_HEADER_SIZE = 8
+
+
+class CacheEntry:
+    """CacheEntry object
+    Output sink writing the stdout of a command to the cache
+    """
+    path: str
+    tmp_path: str
+    f: BinaryIO
+
+    def __init__(self, path: str):
+        self.path = path
+        # Unique per run: identical runs may be done by several threads of a process
+        fd, self.tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=f"{os.path.basename(path)}.",
+                                             suffix=".tmp")
+        self.f = os.fdopen(fd, "wb")
+        self.f.write(b" " * (CACHE_HEADER_SIZE - 1) + b"\n")
+
+    def write(self, stream: str, data: bytes):
+        if stream == "stdout":
+            self.f.write(data)
+
+    def close(self, code: int):
+        """Save the entry with the exit code of the command
+
+        Args:
+            code (int): exit code
+        """
+        self.f.seek(0)
+        self.f.write(str(code).rjust(CACHE_HEADER_SIZE - 1).encode())
+        self.f.close()
+        os.replace(self.tmp_path, self.path)
+
+    def discard(self):
+        """Remove the entry without saving it
+        """
+        self.f.close()
+        os.remove(self.tmp_path)
+
+
+class cache:
+    """Static class for command output cache
+    """
+
+    @staticmethod
+    def key(cmd: CommandFile, values: list[str]) -> str:
+        """Return the cache key of a command run
+
+        Args:
+            cmd (CommandFile): command file
+            values (list[str]): parameter values
+
+        Returns:
+            str: cache key
+        """
+        digest = hashlib.sha256()
+        with open(cmd.path, "rb") as f:
+            digest.update(f.read())
+        for value in values:
+            digest.update(b"\0" + value.encode())
+        return digest.hexdigest()
+
+    @staticmethod
+    def stream(store: str, key: str, ttl: int, sinks: list) -> int:
+        """Write a cached output to output sinks
+
+        Args:
+            store (str): store path
+            key (str): cache key
+            ttl (int): time to live in seconds
+            sinks (list): objects with a write(stream: str, data: bytes) method
+
+        Returns:
+            int: exit code of the cached run, None if there is no valid entry
+        """
+        path = state.path(store, "cache", key)
+        try:
+            with open(path, "rb") as f:
+                stats = os.fstat(f.fileno())
+                if time.time() - stats.st_mtime > ttl:
+                    return None
+                code = int(f.read(CACHE_HEADER_SIZE))
+                # Access time is used for LRU eviction
+                os.utime(path, (time.time(), stats.st_mtime))
+                while True:
+                    data = f.read(65536)
+                    if data == b"":
+                        break
+                    for sink in sinks:
+                        sink.write("stdout", data)
+                return code
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def entry(store: str, key: str) -> CacheEntry:
+        """Create a new cache entry
+
+        Args:
+            store (str): store path
+            key (str): cache key
+
+        Returns:
+            CacheEntry: cache entry, to be used as an output sink
+        """
+        return CacheEntry(state.path(store, "cache", key))
+
+    @staticmethod
+    def evict(store: str, max_size: int = CACHE_MAX_SIZE):
+        """Remove least recently used entries until cache size is below the limit
+
+        Args:
+            store (str): store path
+            max_size (int, optional): maximum cache size in bytes. Defaults to CACHE_MAX_SIZE.
+        """
+        root = os.path.dirname(state.path(store, "cache", ""))
+        entries = []
+        total = 0
+        for item in os.scandir(root):
+            if item.is_file() and not item.name.endswith(".tmp"):
+                try:
+                    stats = item.stat()
+                except FileNotFoundError:
+                    # Removed by another eviction
+                    continue
+                entries.append((stats.st_atime, stats.st_size, item.path))
+                total += stats.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
@@ -0,0 +1,224 @@
+# Copyright (C) 2022 Sebastien Guerri
+#
+# This file is part of pbash.
+#
+# pbash is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# pbash is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Validate command files (bash syntax and headers)
+"""
+
+import re
+import json
+import hashlib
+import subprocess
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+from .state import state
+from .fileio import fileio
+from .cron import CronExpr
+from .dag import dag
+from .units import units
+from .commands import CommandFile, CommandFileParam, VALUE_HEADERS
+
+
+# Bump to invalidate cached results when validation rules change
+CHECK_VERSION = 2
+
+PARAM_NAME = re.compile(r"^[A-Za-z0-9_][A-Za-z0-9_-]*$")
+
+
+class CheckResult:
+    """CheckResult object
+    """
+    cmd: CommandFile
+    sha: str
+    errors: list[str]
+    cached: bool
+
+    def __init__(self, cmd: CommandFile, sha: str, errors: list[str], cached: bool):
+        self.cmd = cmd
+        self.sha = sha
+        self.errors = errors
+        self.cached = cached
+
+    @property
+    def ok(self) -> bool:
+        return len(self.errors) == 0
+
+    def to_json(self) -> json:
+        json_item: json = {}
+        json_item["path"] = self.cmd.path
+        json_item["name"] = self.cmd.f_name
+        json_item["sha256"] = self.sha
+        json_item["ok"] = self.ok
+        json_item["errors"] = self.errors
+        return json_item
+
+
+class check:
+    """Static class for command file validation
+    """
+
+    @staticmethod
+    def headers(content: str) -> list[str]:
+        """Validate the header lines of a command file
+
+        Args:
+            content (str): file content
+
+        Returns:
+            list[str]: errors
+        """
+        errors: list[str] = []
+        names: list[str] = []
+        for number, line in enumerate(content.splitlines(), 1):
+            if not line.startswith("#"):
+                continue
+            if line.startswith("#PARAM"):
+                items = CommandFileParam.split(line.removeprefix("#PARAM").strip())
+                name = items[0].strip()
+                if len(items) > 5:
+                    errors.append(f"line {number}: #PARAM has {len(items)} fields, expected at most 5")
+                if not PARAM_NAME.match(name):
+                    errors.append(f"line {number}: #PARAM name <{name}> is not a valid option name")
+                elif name in names:
+                    errors.append(f"line {number}: #PARAM <{name}> is already defined")
+                names.append(name)
+                if len(items) > 3 and items[3].strip().lower() not in ("true", "false"):
+                    errors.append(f"line {number}: #PARAM ask_always <{items[3].strip()}> must be true or false")
+                if len(items) > 4:
+                    try:
+                        units.duration(items[4])
+                    except AssertionError:
+                        errors.append(f"line {number}: #PARAM cache duration <{items[4].strip()}> is incorrect")
+            for header, (attribute, parser) in VALUE_HEADERS.items():
+                if line.startswith(header):
+                    try:
+                        parser(line.removeprefix(header).strip())
+                    except (AssertionError, ValueError):
+                        errors.append(f"line {number}: incorrect value for {header.strip()}")
+            if line.startswith("#SCHEDULE "):
+                try:
+                    # An expression may be valid but never match (ex: 0 0 30 2 *)
+                    CronExpr(line.removeprefix("#SCHEDULE ")).next(datetime.now())
+                except (AssertionError, ValueError) as error:
+                    errors.append(f"line {number}: {error}")
+        return errors
+
+    @staticmethod
+    def validate(content: bytes) -> list[str]:
+        """Validate a command file content, run in a worker process
+
+        Args:
+            content (bytes): file content
+
+        Returns:
+            list[str]: errors
+        """
+        # Content is given on stdin so that messages do not depend on the file path
+        process = subprocess.run(["bash", "-n"], input=content, capture_output=True)
+        errors = [line.removeprefix("bash: ") for line in process.stderr.decode(errors="replace").splitlines()]
+        if process.returncode != 0 and len(errors) == 0:
+            errors.append(f"bash -n failed with exit code {process.returncode}")
+        return errors + check.headers(content.decode(errors="replace"))
+
+    @staticmethod
+    def load(cache_path: str) -> dict[str, list[str]]:
+        """Read cached results
+
+        Args:
+            cache_path (str): cache file path
+
+        Returns:
+            dict[str, list[str]]: errors by content hash
+        """
+        try:
+            with open(cache_path) as f:
+                cache = json.load(f)
+            assert (cache.get("version") == CHECK_VERSION)
+            return cache["results"]
+        except (OSError, ValueError, AssertionError, KeyError):
+            return {}
+
+    @staticmethod
+    def run(store: str, items: list[CommandFile], workers: int = None, prune: bool = False,
+            catalog: list[CommandFile] = None) -> list[CheckResult]:
+        """Validate command files
+        Results are cached by content hash, only new or modified files are validated, in a process pool
+
+        Args:
+            store (str): store path
+            items (list[CommandFile]): list of command files
+            workers (int, optional): number of processes. Defaults to the number of cpus.
+            prune (bool, optional): if True, only keep cached results of items (all files checked). Defaults to False.
+            catalog (list[CommandFile], optional): all command files, to check #DEPENDS names. Defaults to None.
+
+        Returns:
+            list[CheckResult]: results, in the order of items
+        """
+        cache_path = state.path(store, "check.json")
+        with fileio.lock(cache_path, shared=True):
+            results = check.load(cache_path)
+
+        contents: dict[str, bytes] = {}
+        shas: list[str] = []
+        for cmd in items:
+            cmd.extract()
+            with open(cmd.path, "rb") as f:
+                content = f.read()
+            sha = hashlib.sha256(content).hexdigest()
+            shas.append(sha)
+            if sha not in results:
+                contents[sha] = content
+
+        cached = set(results.keys()) & set(shas)
+        checked: dict[str, list[str]] = {}
+        if len(contents) == 1:
+            # No pool needed for a single file (ex: after edit)
+            sha, content = contents.popitem()
+            checked[sha] = check.validate(content)
+        elif len(contents) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                for sha, errors in zip(contents.keys(), pool.map(check.validate, contents.values(), chunksize=8)):
+                    checked[sha] = errors
+
+        with fileio.lock(cache_path):
+            # Results saved by a concurrent check are kept
+            results = check.load(cache_path)
+            results.update(checked)
+            if prune:
+                # Only keep results of current files
+                results = {sha: results[sha] for sha in shas}
+            fileio.write(cache_path, json.dumps({"version": CHECK_VERSION, "results": results}))
+
+        checked: list[CheckResult] = []
+        for cmd, sha in zip(items, shas):
+            errors = list(results[sha])
+            unknown = False
+            for name in cmd.depends if catalog is not None else ():
+                # Not cached: depends on other files
+                try:
+                    dag.find(catalog, name)
+                except AssertionError as error:
+                    errors.append(f"#DEPENDS: {error}")
+                    unknown = True
+            if catalog is not None and len(cmd.depends) > 0 and not unknown:
+                # Dependency cycles and errors of dependencies, as found by run --with-deps
+                try:
+                    dag.build(catalog, next((c for c in catalog if c.path == cmd.path), cmd))
+                except AssertionError as error:
+                    errors.append(f"#DEPENDS: {error}")
+            checked.append(CheckResult(cmd, sha, errors, sha in cached))
+        return checked
@@ -19,23 +19,62 @@
 """
 
 import os
+import sys
+import time
 import stat
 import json
+import threading
+
+from typing import Optional
+
+from .units import units
+from .state import STATE_DIR
+from .bundle import bundle
+from .ignore import ignore, IgnoreFile, IGNORE_FILE
+from .metrics import metrics
+from .mirror import mirror
+from .index import index
+from .git import git
+
+
+CATALOG_TIMEOUT = 5.0
+# Files read from git for the persisted catalog
+INDEX_PATHSPEC = ["*.sh", f"*{IGNORE_FILE}"]
+
+# Headers with a numeric value: header -> (attribute, parser)
+VALUE_HEADERS = {
+    "#CACHE ": ("cache_ttl", units.duration),
+    "#TIMEOUT ": ("timeout", units.duration),
+    "#MAXMEM ": ("maxmem", units.size),
+    "#MAXCPU ": ("maxcpu", units.duration),
+    "#NICE ": ("nice", int),
+    "#MAXCONCURRENT ": ("max_concurrent", int),
+}
 
 
 class CommandFileParam:
     """CommandFileParam object
+    Identical #PARAM lines share the same object, which must not be modified
     """
+    __slots__ = ("name", "message", "default", "ask_always", "ttl")
     name: str
     message: str
     default: str
     ask_always: bool
+    ttl: int
 
-    def __init__(self, name: str, message: str, default: str, ask_always: bool):
+    def __init__(self, name: str, message: str, default: str, ask_always: bool, ttl: int = 0):
         self.name = name
         self.message = message
         self.default = default
         self.ask_always = ask_always
+        self.ttl = ttl
+
+    @property
+    def dynamic(self) -> bool:
+        """True if the default value is computed by a command: $(cmd)
+        """
+        return self.default.startswith("$(") and self.default.endswith(")")
 
     def to_json(self) -> json:
         json_item: json = {}
@@ -43,45 +82,148 @@ class CommandFileParam:
         json_item["message"] = self.message
         json_item["default"] = self.default
         json_item["ask_always"] = self.ask_always
+        json_item["ttl"] = self.ttl
         return json_item
 
+    @staticmethod
+    def split(content: str) -> list[str]:
+        """Split a #PARAM line content on commas, except inside $(...) defaults
+
+        Args:
+            content (str): line content after #PARAM
+
+        Returns:
+            list[str]: fields
+        """
+        items = [""]
+        depth = 0
+        for i, c in enumerate(content):
+            if c == "(" and i > 0 and content[i - 1] == "$":
+                depth += 1
+            elif c == ")" and depth > 0:
+                depth -= 1
+            elif c == "," and depth == 0:
+                items.append("")
+                continue
+            items[-1] += c
+        return items
+
+    @staticmethod
+    def parse(content: str) -> "CommandFileParam":
+        """Return the param of a #PARAM line content, shared with identical lines
+
+        Args:
+            content (str): line content after #PARAM
+
+        Returns:
+            CommandFileParam: param
+        """
+        param = PARAMS.get(content)
+        if param is None:
+            items = CommandFileParam.split(content)
+            param_name = items[0].strip()
+            param_help = items[1].strip() if len(items) > 1 else ""
+            param_default = items[2].strip() if len(items) > 2 else ""
+            param_askalways = items[3].strip().lower() == "true" if len(items) > 3 else False
+            try:
+                param_ttl = units.duration(items[4]) if len(items) > 4 else 0
+            except AssertionError:
+                # Incorrect values are ignored
+                param_ttl = 0
+            param = CommandFileParam(param_name, param_help, param_default, param_askalways, param_ttl)
+            PARAMS[content] = param
+        return param
+
+
+# Shared params, by #PARAM line content
+PARAMS: dict[str, CommandFileParam] = {}
+
 
 class CommandFile:
     """CommandFile object
+    Only the path and the parsed headers are stored, other names are computed when used
     """
+    __slots__ = ("path", "root_name", "desc", "params", "cache_ttl", "timeout", "maxmem", "maxcpu", "nice",
+                 "max_concurrent", "depends", "log", "schedule", "bundle")
     path: str
-    root: str
     root_name: str
-    f: str
-    f_name: str
     desc: str
-    params: list[CommandFileParam]
+    params: tuple[CommandFileParam, ...]
+    cache_ttl: int
+    timeout: int
+    maxmem: int
+    maxcpu: int
+    nice: int
+    max_concurrent: int
+    depends: tuple[str, ...]
+    log: bool
+    schedule: str
+    bundle: str
 
     def __init__(self, base: str, path: str):
-        base = os.path.dirname(base)
+        base = os.path.dirname(os.path.join(base, ""))
         self.path = path
-        self.root = os.path.dirname(self.path)
-        self.root_name = self.root.replace(base, "")
-        self.root_name = "/" if self.root_name == "" else self.root_name
-        self.f = os.path.basename(self.path)
-        self.f_name = self.f.replace(".sh", "")
+        root_name = os.path.dirname(path).replace(base, "")
+        self.root_name = sys.intern("/" if root_name == "" else root_name)
         self.desc = ""
-        self.params = []
-
-        f = open(path)
-        lines = f.readlines()
-        for line in lines:
-            if line.startswith("#DESC "):
-                self.desc = line.removeprefix("#DESC ").strip()
-            if line.startswith("#PARAM"):
-                content = line.removeprefix("#PARAM").strip()
-                items = content.split(",")
-                param_name = items[0].strip()
-                param_help = items[1].strip() if len(items) > 1 else ""
-                param_default = items[2].strip() if len(items) > 2 else ""
-                param_askalways = items[3].strip().lower() == "true" if len(items) > 3 else False
-                self.params.append(CommandFileParam(param_name, param_help, param_default, param_askalways))
-        f.close()
+        self.params = ()
+        self.cache_ttl = 0
+        self.timeout = 0
+        self.maxmem = 0
+        self.maxcpu = 0
+        self.nice = 0
+        self.max_concurrent = 0
+        self.depends = ()
+        self.log = False
+        self.schedule = ""
+        self.bundle = ""
+
+        params = []
+        with open(path) as f:
+            for line in f:
+                if line.startswith("#"):
+                    self.parse_header(line, params)
+        self.params = tuple(params)
+
+    def parse_header(self, line: str, params: list[CommandFileParam]):
+        """Parse a header line
+
+        Args:
+            line (str): line beginning with #
+            params (list[CommandFileParam]): list of params, completed with #PARAM lines
+        """
+        if line.startswith("#DESC "):
+            self.desc = line.removeprefix("#DESC ").strip()
+        if line.startswith("#PARAM"):
+            params.append(CommandFileParam.parse(line.removeprefix("#PARAM").strip()))
+        for header, (attribute, parser) in VALUE_HEADERS.items():
+            if line.startswith(header):
+                try:
+                    setattr(self, attribute, parser(line.removeprefix(header).strip()))
+                except (AssertionError, ValueError):
+                    # Incorrect values are ignored
+                    pass
+        if line.strip() == "#LOCK":
+            self.max_concurrent = 1
+        if line.strip() == "#LOG":
+            self.log = True
+        if line.startswith("#SCHEDULE "):
+            self.schedule = line.removeprefix("#SCHEDULE ").strip()
+        if line.startswith("#DEPENDS "):
+            items = line.removeprefix("#DEPENDS ").split(",")
+            self.depends += tuple(item.strip() for item in items if item.strip() != "")
+
+    @property
+    def root(self) -> str:
+        return os.path.dirname(self.path)
+
+    @property
+    def f(self) -> str:
+        return os.path.basename(self.path)
+
+    @property
+    def f_name(self) -> str:
+        return self.f.replace(".sh", "")
 
     def to_json(self) -> json:
         json_item: json = {}
@@ -92,8 +234,91 @@ class CommandFile:
         json_item["f_name"] = self.f_name
         json_item["desc"] = self.desc
         json_item["params"] = list(map(lambda p: p.to_json(), self.params))
+        json_item["cache_ttl"] = self.cache_ttl
+        json_item["timeout"] = self.timeout
+        json_item["maxmem"] = self.maxmem
+        json_item["maxcpu"] = self.maxcpu
+        json_item["nice"] = self.nice
+        json_item["max_concurrent"] = self.max_concurrent
+        json_item["depends"] = list(self.depends)
+        json_item["log"] = self.log
+        json_item["schedule"] = self.schedule
         return json_item
 
+    @staticmethod
+    def from_json(entry: json) -> "CommandFile":
+        """Create a command file from parsed headers (see to_json), without reading the script
+
+        Args:
+            entry (json): parsed headers
+
+        Returns:
+            CommandFile: command file
+        """
+        cmd = CommandFile.__new__(CommandFile)
+        for attribute in CommandFile.__slots__:
+            if attribute in entry:
+                setattr(cmd, attribute, entry[attribute])
+        cmd.root_name = sys.intern(cmd.root_name)
+        cmd.params = tuple(map(lambda p: CommandFileParam(p["name"], p["message"], p["default"], p["ask_always"],
+                                                          p.get("ttl", 0)), entry["params"]))
+        cmd.depends = tuple(cmd.depends)
+        cmd.bundle = ""
+        return cmd
+
+    @staticmethod
+    def from_bundle(path: str, entry: json) -> "CommandFile":
+        """Create a command file from a bundle index entry, without reading the script
+
+        Args:
+            path (str): bundle file path
+            entry (json): bundle index entry
+
+        Returns:
+            CommandFile: command file
+        """
+        cmd = CommandFile.from_json(entry)
+        cmd.path = bundle.script_path(entry["sha256"], entry["f"])
+        cmd.bundle = path
+        return cmd
+
+    @staticmethod
+    def from_index(store: str, rel: str, entry: json) -> "CommandFile":
+        """Create a command file from a persisted catalog entry, without reading the script
+
+        Args:
+            store (str): store path
+            rel (str): file path relative to the store
+            entry (json): persisted catalog entry
+
+        Returns:
+            CommandFile: command file
+        """
+        cmd = CommandFile.from_json(entry)
+        cmd.path = os.path.join(store, rel)
+        cmd.root_name = sys.intern(os.sep + os.path.dirname(rel))
+        return cmd
+
+    def extract(self):
+        """Extract the script from its bundle if needed, so that it can be read and run
+        """
+        if self.bundle != "":
+            bundle.extract(self.bundle, os.path.basename(self.root), self.f)
+
+
+class Catalog:
+    """Catalog object
+    Merged command files of several roots
+    """
+    items: list[CommandFile]
+    shadowed: list[CommandFile]
+    skipped: dict[str, str]
+
+    def __init__(self):
+        self.items = []
+        self.shadowed = []
+        self.skipped = {}
+
 
 class commands:
     """Static class for command files
@@ -109,30 +334,82 @@ class commands:
             param (list[str]): list of parameters
         """
         f = open(path, "w")
-        f.write("#!/bin/bash\n")
-        if desc != "":
-            f.write(f"#DESC {desc}\n")
-        for p in param:
-            f.write(f"#PARAM {p}\n")
+        f.write(commands.header("#!/bin/bash", desc, param))
         f.write("echo \"Hello World!\"\n")
         f.close()
         os.chmod(path, stat.S_IRWXU | stat.S_IRWXG | stat.S_IROTH | stat.S_IXOTH)
 
     @staticmethod
-    def get_list(path: str, filter: str = "") -> list[CommandFile]:
-        """Return the list of command files
+    def header(shebang: str, desc: str, param: list[str]) -> str:
+        """Return the header lines of a command file
+
+        Args:
+            shebang (str): first line
+            desc (str): file description
+            param (list[str]): list of parameters
+
+        Returns:
+            str: header lines
+        """
+        content = f"{shebang}\n"
+        if desc != "":
+            content += f"#DESC {desc}\n"
+        for p in param:
+            content += f"#PARAM {p}\n"
+        return content
+
+    @staticmethod
+    def parse_filter(filter: str) -> tuple[str, str]:
+        """Split a filter into a folder and a name filter
+        A filter with a "/" is scoped to a folder (ex: "ops/db/" or "ops/db/back"), otherwise folder is None
+
+        Args:
+            filter (str): name filter
+
+        Returns:
+            tuple[str, str]: folder (lowercase, None if not scoped) and name filter
+        """
+        filter = filter.lstrip("/")
+        if "/" not in filter:
+            return None, filter
+        folder, name = filter.rsplit("/", 1)
+        return folder.strip("/").lower().replace("/", os.sep), name
+
+    @staticmethod
+    def in_folder(folder: str, root_name: str) -> bool:
+        """Check if a directory is in a filter folder
+
+        Args:
+            folder (str): filter folder, as returned by parse_filter
+            root_name (str): directory name, relative to the store
+
+        Returns:
+            bool: True if the directory is the folder or one of its subdirectories
+        """
+        root_name = root_name.strip(os.sep).lower()
+        return folder == "" or root_name == folder or root_name.startswith(folder + os.sep)
+
+    @staticmethod
+    def get_paths(path: str, filter: str = "") -> list[str]:
+        """Return the list of command file paths
+        With a folder filter, only the matching subtree is visited
 
         Args:
             path (str): working directory
             filter (str): name filter
 
         Returns:
-            list[CommandFile]: list of command files
+            list[str]: list of command file paths
         """
         assert (os.path.exists(path)), f"Path <{path}> does not exist"
         assert (os.path.isdir(path)), f"Path <{path}> is not a valid directory"
 
-        items: list[CommandFile] = []
+        # Trailing separator: the root directory itself has an empty relative name
+        path = os.path.join(path, "")
+        folder, name = commands.parse_filter(filter)
+        items: list[str] = []
+        # Ignore files of each visited directory and its parents, compiled once per scan
+        ignores: dict[str, list[IgnoreFile]] = {}
         for (root, dirs, files) in os.walk(path):
             # Loop all directories (only one level)
             dirs.sort()
@@ -144,11 +421,29 @@ class commands:
             if ".git" in root_name:
                 # Skip git directory
                 continue
-            if filter == "" or filter.lower() in root_name.lower():
+            if root_name.split(os.sep)[0] == STATE_DIR:
+                # Skip application state directory
+                dirs.clear()
+                continue
+
+            root_ignores = ignores.get(os.path.dirname(root_name), []) if root_name != "" else []
+            if IGNORE_FILE in files:
+                root_ignores = root_ignores + [ignore.load(root, root_name)]
+            if len(root_ignores) > 0:
+                # Prune ignored directories before descending
+                ignores[root_name] = root_ignores
+                dirs[:] = [d for d in dirs if not ignore.is_ignored(root_ignores, os.path.join(root_name, d), True)]
+                files = [f for f in files if f.endswith(".sh")
+                         and not ignore.is_ignored(root_ignores, os.path.join(root_name, f), False)]
+
+            if folder is not None and not commands.in_folder(folder, root_name):
+                # Only descend towards the filter folder
+                prefix = folder + os.sep
+                dirs[:] = [d for d in dirs if prefix.startswith(os.path.join(root_name, d).lower() + os.sep)]
+                continue
+            if folder is not None and name == "":
                 # Check directory name vs filter
-                # is_root_ok = True
-                # TODO set this flag to True with enhanced filters
-                pass
+                is_root_ok = True
 
             for f in files:
                 # Loop all files
@@ -158,12 +453,280 @@ class commands:
                 if not f.endswith(".sh"):
                     # Skip non sh files
                     continue
-                if filter == "" or filter.lower() in f_name.lower():
+                if name == "" or name.lower() in f_name.lower():
                     # Check file name vs filter
                     is_file_ok = True
                 if is_file_ok:
                     # Add to returned list
-                    # items.append(CommandFile(root, root_name, f, f_name, os.path.join(root, f)))
-                    items.append(CommandFile(path, os.path.join(root, f)))
+                    items.append(os.path.join(root, f))
+
+        return items
+
+    @staticmethod
+    def get_list(path: str, filter: str = "", parsed: Optional[dict] = None) -> list[CommandFile]:
+        """Return the list of command files
+
+        Args:
+            path (str): working directory
+            filter (str): name filter
+            parsed (dict, optional): command files of a previous scan by path, with their mtime and size, updated
+                with this scan: unchanged files are not parsed again. Defaults to None.
+
+        Returns:
+            list[CommandFile]: list of command files
+        """
+        if bundle.is_bundle(path):
+            entries = bundle.read_index(path)
+            folder, name = commands.parse_filter(filter)
+            entries = [e for e in entries
+                       if (folder is None or commands.in_folder(folder, e["root_name"]))
+                       and name.lower() in e["f_name"].lower()]
+            return list(map(lambda e: CommandFile.from_bundle(path, e), entries))
+        if index.exists(path):
+            items = commands.get_indexed(path, filter)
+            if items is not None:
+                return items
+        if parsed is None:
+            return list(map(lambda p: CommandFile(path, p), commands.get_paths(path, filter)))
+        current: dict[str, tuple[tuple[int, int], CommandFile]] = {}
+        for p in commands.get_paths(path, filter):
+            stats = os.stat(p)
+            stamp = (stats.st_mtime_ns, stats.st_size)
+            entry = parsed.get(p)
+            current[p] = entry if entry is not None and entry[0] == stamp else (stamp, CommandFile(path, p))
+        parsed.clear()
+        parsed.update(current)
+        return [cmd for _, cmd in current.values()]
+
+    @staticmethod
+    def parse_indexed(store: str, rel: str, loaded: dict[str, IgnoreFile]) -> json:
+        """Parse a command file of a store without scanning the store
+
+        Args:
+            store (str): store path
+            rel (str): file path relative to the store
+            loaded (dict[str, IgnoreFile]): ignore files already read (see ignore.is_excluded)
+
+        Returns:
+            json: parsed headers, None if the file is missing, is not a command file or is ignored
+        """
+        path = os.path.join(store, rel)
+        if not rel.endswith(".sh") or ".git" in os.path.dirname(rel) or rel.split(os.sep)[0] == STATE_DIR:
+            return None
+        if not os.path.isfile(path) or ignore.is_excluded(store, rel, loaded):
+            return None
+        return CommandFile(store, path).to_json()
+
+    @staticmethod
+    def update_index(store: str, head: str = "", dirty: list[str] = None) -> dict[str, json]:
+        """Update the persisted catalog of a git store to the current commit
+        Only the files changed since the saved commit are parsed (ex: 3 files after a pull, whatever the store
+        size). All files are parsed if there is no persisted catalog, if the commits cannot be compared (ex:
+        rewritten history) or if an ignore file changed.
+
+        Args:
+            store (str): store path
+            head (str, optional): current commit. Defaults to "" (read from git).
+            dirty (list[str], optional): paths not matching the current commit. Defaults to None (read from git).
+
+        Returns:
+            dict[str, json]: parsed headers by path relative to the store, without dirty paths, None if the store
+            is not a git repository top level directory
+        """
+        head = head or git.head(store)
+        dirty = dirty if dirty is not None else git.dirty(store, INDEX_PATHSPEC)
+        if head == "" or dirty is None:
+            return None
+        data = index.load(store)
+        changed = None
+        if data is not None:
+            changed = [] if data["head"] == head else git.changes(store, data["head"], head)
+        if changed is not None:
+            # Files dirty when saved may now match the commit
+            changed = set(changed).union(data["dirty"], dirty)
+            if data["dirty"] == dirty and len(changed) == len(dirty):
+                return data["entries"]
+        if changed is None or any(os.path.basename(p) == IGNORE_FILE for p in changed):
+            entries = {os.path.relpath(p, store): CommandFile(store, p).to_json() for p in commands.get_paths(store)}
+            changed = set(dirty)
+        else:
+            entries = data["entries"]
+
+        loaded: dict[str, IgnoreFile] = {}
+        for rel in changed:
+            entries.pop(rel, None)
+            if rel not in dirty:
+                entry = commands.parse_indexed(store, rel, loaded)
+                if entry is not None:
+                    entries[rel] = entry
+        index.save(store, head, dirty, entries)
+        return entries
+
+    @staticmethod
+    def get_indexed(store: str, filter: str = "") -> list[CommandFile]:
+        """Return the list of command files of a git store from its persisted catalog
+        Uncommitted files are parsed at each call
+
+        Args:
+            store (str): store path
+            filter (str): name filter
 
+        Returns:
+            list[CommandFile]: list of command files, None if the catalog cannot be used (the store is scanned)
+        """
+        dirty = git.dirty(store, INDEX_PATHSPEC)
+        if dirty is None or any(os.path.basename(p) == IGNORE_FILE for p in dirty):
+            return None
+        entries = commands.update_index(store, dirty=dirty)
+        if entries is None:
+            return None
+        entries = dict(entries)
+        loaded: dict[str, IgnoreFile] = {}
+        for rel in dirty:
+            entry = commands.parse_indexed(store, rel, loaded)
+            if entry is not None:
+                entries[rel] = entry
+
+        folder, name = commands.parse_filter(filter)
+        items: list[CommandFile] = []
+        # Same order as a store scan: files of a directory, then its subdirectories
+        for rel in sorted(entries, key=lambda r: tuple((1, d) for d in r.split(os.sep)[:-1]) + ((0, r),)):
+            if folder is not None and not commands.in_folder(folder, os.path.dirname(rel)):
+                continue
+            if name.lower() in os.path.basename(rel).replace(".sh", "").lower():
+                items.append(CommandFile.from_index(store, rel, entries[rel]))
+        return items
+
+    @staticmethod
+    def get_root_list(root: str, filter: str = "", mirrored: bool = False,
+                      parsed: Optional[dict] = None) -> list[CommandFile]:
+        """Return the list of command files of a root
+        A mirrored root is parsed from its local mirror, but command paths are in the root: scripts run next to the
+        files they use (sourced files, config files...)
+
+        Args:
+            root (str): root path
+            filter (str): name filter
+            mirrored (bool, optional): if True, the local mirror is updated and parsed. Defaults to False.
+            parsed (dict, optional): command files of a previous scan, see get_list. Not used for a mirrored root,
+                which is parsed from local copies. Defaults to None.
+
+        Returns:
+            list[CommandFile]: list of command files
+        """
+        if not mirrored or not os.path.isdir(root):
+            return commands.get_list(root, filter, parsed)
+        target = mirror.sync(root)
+        items = commands.get_list(target, filter)
+        for cmd in items:
+            cmd.path = os.path.join(root, os.path.relpath(cmd.path, target))
         return items
+
+    @staticmethod
+    def get_current(cmd: CommandFile, roots: list[str], mirrored: bool = False) -> CommandFile:
+        """Return a command file with up to date headers, before running it
+        The mirror only compares the files of changed directories, so a script modified in place may have been
+        parsed from an outdated copy: it is parsed again from its root
+
+        Args:
+            cmd (CommandFile): command file
+            roots (list[str]): root paths
+            mirrored (bool, optional): if True, roots are read from their local mirror. Defaults to False.
+
+        Returns:
+            CommandFile: command file, parsed again if its mirror copy is outdated
+        """
+        if not mirrored or cmd.bundle != "":
+            return cmd
+        for root in roots:
+            if cmd.path.startswith(os.path.join(root, "")):
+                if mirror.is_current(root, cmd.path) or not os.path.isfile(cmd.path):
+                    return cmd
+                current = CommandFile(root, cmd.path)
+                current.root_name = cmd.root_name
+                return current
+        return cmd
+
+    @staticmethod
+    def key(cmd: CommandFile) -> str:
+        """Return the name of a command relative to its root (ex: folder/name)
+
+        Args:
+            cmd (CommandFile): command file
+
+        Returns:
+            str: relative name
+        """
+        return f"{cmd.root_name.strip('/')}/{cmd.f_name}".lstrip("/")
+
+    @staticmethod
+    def get_catalog(roots: list[str], filter: str = "", timeout: float = CATALOG_TIMEOUT,
+                    mirrored: bool = False, parsed: Optional[dict[str, dict]] = None) -> Catalog:
+        """Return the merged list of command files of several roots
+        Roots are scanned concurrently. A command of a root shadows the command with the same relative name in the
+        following roots. Overlays which cannot be read, or not scanned before timeout, are skipped: only an error
+        of the store itself (first root) is raised.
+
+        Args:
+            roots (list[str]): root paths, highest priority first
+            filter (str): name filter
+            timeout (float, optional): maximum scan duration in seconds. Defaults to CATALOG_TIMEOUT.
+            mirrored (bool, optional): if True, roots are read from their local mirror. Defaults to False.
+            parsed (dict[str, dict], optional): command files of previous scans by root, see get_list (ex: kept by
+                a long running process). Defaults to None.
+
+        Returns:
+            Catalog: catalog (skipped roots with the reason)
+        """
+        started = time.time()
+        catalog = Catalog()
+        if len(roots) == 1:
+            # No thread needed for a single root
+            catalog.items = commands.get_root_list(roots[0], filter, mirrored,
+                                                   None if parsed is None else parsed.setdefault(roots[0], {}))
+            metrics.observe_scan(roots[0], time.time() - started, len(catalog.items))
+            return catalog
+
+        results: dict[int, list[CommandFile]] = {}
+        errors: dict[int, Exception] = {}
+        done = threading.Condition()
+
+        def scan(position: int, root: str, root_parsed: Optional[dict]):
+            try:
+                items = commands.get_root_list(root, filter, mirrored, root_parsed)
+                with done:
+                    results[position] = items
+                    done.notify()
+            except Exception as error:
+                with done:
+                    errors[position] = error
+                    done.notify()
+
+        for position, root in enumerate(roots):
+            # Daemon threads: a slow root never delays the end of the application
+            root_parsed = None if parsed is None else parsed.setdefault(root, {})
+            threading.Thread(target=scan, args=(position, root, root_parsed), daemon=True).start()
+        deadline = time.time() + timeout
+        with done:
+            while len(results) + len(errors) < len(roots) and time.time() < deadline:
+                done.wait(deadline - time.time())
+
+            names: set[str] = set()
+            for position, root in enumerate(roots):
+                if position in errors:
+                    if position == 0:
+                        raise errors[position]
+                    catalog.skipped[root] = str(errors[position])
+                    continue
+                if position not in results:
+                    catalog.skipped[root] = "not read in time"
+                    continue
+                for cmd in results[position]:
+                    key = commands.key(cmd)
+                    if key in names:
+                        catalog.shadowed.append(cmd)
+                    else:
+                        names.add(key)
+                        catalog.items.append(cmd)
+        metrics.observe_scan(roots[0], time.time() - started, len(catalog.items) + len(catalog.shadowed))
+        return catalog
@@ -0,0 +1,138 @@
+# Copyright (C) 2022 Sebastien Guerri
+#
+# This file is part of pbash.
+#
+# pbash is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# pbash is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Handle cron expressions
+"""
+
+from datetime import datetime, timedelta
+
+
+CRON_MACROS = {
+    "@yearly": "0 0 1 1 *",
+    "@annually": "0 0 1 1 *",
+    "@monthly": "0 0 1 * *",
+    "@weekly": "0 0 * * 0",
+    "@daily": "0 0 * * *",
+    "@midnight": "0 0 * * *",
+    "@hourly": "0 * * * *",
+}
+CRON_NAMES = {
+    "jan": 1, "feb": 2, "mar": 3, "apr": 4, "may": 5, "jun": 6,
+    "jul": 7, "aug": 8, "sep": 9, "oct": 10, "nov": 11, "dec": 12,
+    "sun": 0, "mon": 1, "tue": 2, "wed": 3, "thu": 4, "fri": 5, "sat": 6,
+}
+CRON_MAX_YEARS = 5
+
+
+class CronExpr:
+    """CronExpr object
+    Standard 5 fields cron expression: minute hour day-of-month month day-of-week
+    """
+    expr: str
+    minutes: set[int]
+    hours: set[int]
+    days: set[int]
+    months: set[int]
+    weekdays: set[int]
+    any_day: bool
+    any_weekday: bool
+
+    def __init__(self, expr: str):
+        self.expr = expr.strip()
+        fields = CRON_MACROS.get(self.expr.lower(), self.expr).split()
+        assert (len(fields) == 5), f"Incorrect cron expression <{expr}>"
+        self.minutes = CronExpr.parse_field(fields[0], 0, 59)
+        self.hours = CronExpr.parse_field(fields[1], 0, 23)
+        self.days = CronExpr.parse_field(fields[2], 1, 31)
+        self.months = CronExpr.parse_field(fields[3], 1, 12)
+        # 7 is also sunday
+        self.weekdays = set(map(lambda d: d % 7, CronExpr.parse_field(fields[4], 0, 7)))
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+
+    @staticmethod
+    def parse_field(field: str, low: int, high: int) -> set[int]:
+        """Parse a cron field
+
+        Args:
+            field (str): field (ex: *, */5, 1-10/2, 1,2,3, mon-fri)
+            low (int): minimum value
+            high (int): maximum value
+
+        Returns:
+            set[int]: allowed values
+        """
+        values: set[int] = set()
+        for part in field.lower().split(","):
+            content, _, step = part.partition("/")
+            step_value = int(step) if step != "" else 1
+            assert (step_value > 0), f"Incorrect cron field <{field}>"
+            if content == "*":
+                start, end = low, high
+            else:
+                first, _, last = content.partition("-")
+                start = CRON_NAMES[first] if first in CRON_NAMES else int(first)
+                end = (CRON_NAMES[last] if last in CRON_NAMES else int(last)) if last != "" else start
+                if step != "" and last == "":
+                    end = high
+            assert (low <= start <= end <= high), f"Incorrect cron field <{field}>"
+            values.update(range(start, end + 1, step_value))
+        return values
+
+    def match_day(self, date: datetime) -> bool:
+        """Check if a day matches the expression
+        When both day of month and day of week are restricted, any of them matches (as cron does)
+
+        Args:
+            date (datetime): day
+
+        Returns:
+            bool: True if the day matches
+        """
+        day_ok = date.day in self.days
+        weekday_ok = (date.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day_ok and weekday_ok
+        return day_ok or weekday_ok
+
+    def next(self, after: datetime) -> datetime:
+        """Return the first matching time strictly after a given time
+
+        Args:
+            after (datetime): start time
+
+        Returns:
+            datetime: next matching time
+        """
+        current = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = after + timedelta(days=366 * CRON_MAX_YEARS)
+        while current < limit:
+            if current.month not in self.months:
+                year = current.year + (1 if current.month == 12 else 0)
+                current = current.replace(year=year, month=current.month % 12 + 1, day=1, hour=0, minute=0)
+                continue
+            if not self.match_day(current):
+                current = current.replace(hour=0, minute=0) + timedelta(days=1)
+                continue
+            if current.hour not in self.hours:
+                current = current.replace(minute=0) + timedelta(hours=1)
+                continue
+            if current.minute not in self.minutes:
+                current = current + timedelta(minutes=1)
+                continue
+            return current
+        assert (False), f"Cron expression <{self.expr}> never matches"
@@ -0,0 +1,162 @@
+# Copyright (C) 2022 Sebastien Guerri
+#
+# This file is part of pbash.
+#
+# pbash is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# pbash is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Handle command dependencies
+"""
+
+from typing import Callable
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from .commands import CommandFile
+from .runner import RunResult
+
+
+class DagStep:
+    """DagStep object
+    """
+    cmd: CommandFile
+    depends: list["DagStep"]
+    values: list[str]
+    status: str
+    result: RunResult
+    error: str
+
+    def __init__(self, cmd: CommandFile):
+        self.cmd = cmd
+        self.depends = []
+        self.values = []
+        self.status = "pending"
+        self.result = None
+        self.error = ""
+
+    def finished(self) -> float:
+        """Return the end time of the step
+
+        Returns:
+            float: end time, 0 if the step did not run
+        """
+        return 0 if self.result is None else self.result.started + self.result.duration
+
+
+class dag:
+    """Static class for command dependencies
+    """
+
+    @staticmethod
+    def find(items: list[CommandFile], name: str) -> CommandFile:
+        """Find a command by name
+        The name is either the file name, or the folder and file name (ex: folder/name)
+
+        Args:
+            items (list[CommandFile]): list of command files
+            name (str): command name
+
+        Returns:
+            CommandFile: command file
+        """
+        name = name.strip().strip("/")
+        found = [c for c in items if c.f_name == name or f"{c.root_name.strip('/')}/{c.f_name}" == name]
+        assert (len(found) != 0), f"Unknown dependency <{name}>"
+        assert (len(found) == 1), f"Dependency <{name}> matches several commands"
+        return found[0]
+
+    @staticmethod
+    def build(items: list[CommandFile], target: CommandFile) -> list[DagStep]:
+        """Build the list of steps needed to run a command
+
+        Args:
+            items (list[CommandFile]): list of command files
+            target (CommandFile): command to run
+
+        Returns:
+            list[DagStep]: steps in dependency order, target being the last one
+        """
+        steps: dict[str, DagStep] = {}
+        ordered: list[DagStep] = []
+        visiting: list[CommandFile] = []
+
+        def visit(cmd: CommandFile) -> DagStep:
+            if cmd.path in steps:
+                return steps[cmd.path]
+            assert (cmd not in visiting), \
+                f"Dependency cycle: {' > '.join(map(lambda c: c.f_name, visiting[visiting.index(cmd):] + [cmd]))}"
+            visiting.append(cmd)
+            step = DagStep(cmd)
+            for name in cmd.depends:
+                step.depends.append(visit(dag.find(items, name)))
+            visiting.pop()
+            steps[cmd.path] = step
+            ordered.append(step)
+            return step
+
+        visit(target)
+        return ordered
+
+    @staticmethod
+    def execute(steps: list[DagStep], jobs: int, run: Callable[[DagStep], RunResult]):
+        """Run steps in parallel, as soon as their dependencies are done
+        Steps depending on a failed step are skipped
+
+        Args:
+            steps (list[DagStep]): steps in dependency order
+            jobs (int): maximum number of parallel steps
+            run (function): function running a step
+        """
+        with ThreadPoolExecutor(max_workers=max(jobs, 1)) as pool:
+            running = {}
+            while True:
+                for step in steps:
+                    # Steps are ordered, so skipped status is propagated in one loop
+                    if step.status != "pending":
+                        continue
+                    if any(map(lambda d: d.status in ["failed", "skipped"], step.depends)):
+                        step.status = "skipped"
+                    elif all(map(lambda d: d.status == "done", step.depends)):
+                        step.status = "running"
+                        running[pool.submit(run, step)] = step
+                if len(running) == 0:
+                    break
+                done, _ = wait(running.keys(), return_when=FIRST_COMPLETED)
+                for future in done:
+                    step = running.pop(future)
+                    try:
+                        step.result = future.result()
+                        step.status = "done" if step.result.code == 0 else "failed"
+                    except Exception as error:
+                        step.error = str(error)
+                        step.status = "failed"
+
+    @staticmethod
+    def critical_path(steps: list[DagStep]) -> list[DagStep]:
+        """Return the chain of steps which determined the total duration
+
+        Args:
+            steps (list[DagStep]): executed steps
+
+        Returns:
+            list[DagStep]: critical path, from first to last step
+        """
+        executed = [s for s in steps if s.result is not None]
+        if len(executed) == 0:
+            return []
+        path = [max(executed, key=lambda s: s.finished())]
+        while True:
+            depends = [d for d in path[0].depends if d.result is not None]
+            if len(depends) == 0:
+                break
+            path.insert(0, max(depends, key=lambda d: d.finished()))
+        return path
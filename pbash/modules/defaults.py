@@ -0,0 +1,107 @@
+# Copyright (C) 2022 Sebastien Guerri
+#
+# This file is part of pbash.
+#
+# pbash is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# pbash is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Evaluate dynamic param defaults: $(cmd)
+"""
+
+import os
+import json
+import time
+import hashlib
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from .state import state
+from .fileio import fileio
+from .commands import CommandFileParam
+
+
+# Maximum duration of a default command in seconds
+DEFAULT_TIMEOUT = 10
+
+
+class defaults:
+    """Static class for dynamic param defaults
+    """
+
+    @staticmethod
+    def cache_path(store: str, param: CommandFileParam) -> str:
+        """Return the cache file of a dynamic default
+        The result of a command depends on the current directory (ex: git branch)
+
+        Args:
+            store (str): store path
+            param (CommandFileParam): param
+
+        Returns:
+            str: cache file path
+        """
+        key = hashlib.sha1(f"{os.getcwd()}\0{param.default}".encode()).hexdigest()
+        return state.path(store, "defaults", key)
+
+    @staticmethod
+    def evaluate(store: str, param: CommandFileParam) -> str:
+        """Evaluate a dynamic default, using the cached value if the param has a cache duration
+
+        Args:
+            store (str): store path, empty for no cache
+            param (CommandFileParam): param
+
+        Returns:
+            str: value, empty if the command failed
+        """
+        path = defaults.cache_path(store, param) if store != "" and param.ttl > 0 else ""
+        if path != "":
+            try:
+                with open(path) as f:
+                    cached = json.load(f)
+                if time.time() - cached["time"] < param.ttl:
+                    return cached["value"]
+            except (OSError, ValueError, KeyError):
+                pass
+        try:
+            process = subprocess.run(["bash", "-c", param.default[2:-1]], stdin=subprocess.DEVNULL,
+                                     capture_output=True, timeout=DEFAULT_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            return ""
+        value = process.stdout.decode(errors="replace").rstrip("\n")
+        if process.returncode != 0:
+            # Failed commands are not cached, value is prompted
+            return ""
+        if path != "":
+            with fileio.lock(path):
+                fileio.write(path, json.dumps({"value": value, "time": time.time()}))
+        return value
+
+    @staticmethod
+    def get(store: str, params: list[CommandFileParam]) -> dict[str, str]:
+        """Evaluate dynamic defaults concurrently
+
+        Args:
+            store (str): store path, empty for no cache
+            params (list[CommandFileParam]): params with a dynamic default
+
+        Returns:
+            dict[str, str]: value by param name
+        """
+        if len(params) == 0:
+            return {}
+        if len(params) == 1:
+            return {params[0].name: defaults.evaluate(store, params[0])}
+        with ThreadPoolExecutor(max_workers=len(params)) as pool:
+            values = pool.map(lambda p: defaults.evaluate(store, p), params)
+            return dict(zip(map(lambda p: p.name, params), values))
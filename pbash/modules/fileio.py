@@ -0,0 +1,79 @@
+# Copyright (C) 2022 Sebastien Guerri
+#
+# This file is part of pbash.
+#
+# pbash is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# pbash is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Safe access to files shared by concurrent pbash processes
+"""
+
+import os
+import fcntl
+import tempfile
+from contextlib import contextmanager
+from typing import Iterator, Union
+
+
+class fileio:
+    """Static class for shared files
+    Readers take a shared lock and never block each other, writers take an exclusive lock and replace the file
+    with an atomic rename, so a file is never seen partially written.
+    """
+
+    @staticmethod
+    @contextmanager
+    def lock(path: str, shared: bool = False) -> Iterator[None]:
+        """Lock a file, using a separate lock file (the file itself is replaced when written)
+
+        Args:
+            path (str): file path
+            shared (bool, optional): if True, shared lock for readers, else exclusive lock. Defaults to False.
+        """
+        with open(f"{path}.lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    @staticmethod
+    def write(path: str, content: Union[str, bytes], sync: bool = True):
+        """Write a file atomically: content is written to a temporary file, then renamed
+        The mode of an existing file is kept
+
+        Args:
+            path (str): file path
+            content (Union[str, bytes]): file content
+            sync (bool, optional): if True, content is flushed to disk before the rename. Without sync, the file may
+                be lost on a system crash, but never partially written for other processes. Defaults to True.
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb" if isinstance(content, bytes) else "w") as f:
+                f.write(content)
+                if sync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            if os.path.exists(path):
+                os.chmod(tmp_path, os.stat(path).st_mode & 0o7777)
+            else:
+                umask = os.umask(0)
+                os.umask(umask)
+                os.chmod(tmp_path, 0o666 & ~umask)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
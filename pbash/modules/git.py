@@ -103,3 +103,63 @@ class git:
         subprocess.run(["git", "-C", path, "add", "."], capture_output=False)
         subprocess.run(["git", "-C", path, "commit", "-m", message], capture_output=False)
         git.push(path, branch)
+
+    @staticmethod
+    def head(path: str) -> str:
+        """Return the current commit
+
+        Args:
+            path (str): working directory
+
+        Returns:
+            str: commit hash, empty if not a git repository top level directory or without commit
+        """
+        process = subprocess.run(["git", "-C", path, "rev-parse", "--show-prefix", "HEAD"], capture_output=True)
+        lines = process.stdout.decode(errors="replace").splitlines()
+        if process.returncode != 0 or len(lines) != 2 or lines[0] != "":
+            return ""
+        return lines[1]
+
+    @staticmethod
+    def changes(path: str, before: str, after: str) -> list[str]:
+        """Return the files changed between two commits
+        Renamed files are given with both names
+
+        Args:
+            path (str): working directory
+            before (str): first commit
+            after (str): last commit
+
+        Returns:
+            list[str]: file paths relative to the working directory, None if the commits cannot be compared
+        """
+        process = subprocess.run(["git", "-C", path, "diff", "--name-status", "-z", "-M", before, after],
+                                 capture_output=True)
+        if process.returncode != 0:
+            return None
+        result: list[str] = []
+        fields = process.stdout.decode(errors="surrogateescape").split("\0")
+        i = 0
+        while i < len(fields) - 1:
+            # Renames and copies have 2 paths
+            count = 2 if fields[i][:1] in ("R", "C") else 1
+            result.extend(fields[i + 1:i + 1 + count])
+            i += 1 + count
+        return result
+
+    @staticmethod
+    def dirty(path: str, pathspec: list[str]) -> list[str]:
+        """Return the files not matching the current commit: modified, deleted, untracked or ignored by git
+
+        Args:
+            path (str): working directory
+            pathspec (list[str]): patterns of the checked files (ex: *.sh)
+
+        Returns:
+            list[str]: file paths relative to the working directory, None if not a git repository
+        """
+        process = subprocess.run(["git", "-C", path, "status", "--porcelain", "-z", "-uall", "--ignored=matching",
+                                  "--no-renames", "--"] + pathspec, capture_output=True)
+        if process.returncode != 0:
+            return None
+        return [item[3:] for item in process.stdout.decode(errors="surrogateescape").split("\0") if item != ""]
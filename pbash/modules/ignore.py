@@ -0,0 +1,177 @@
+# Copyright (C) 2022 Sebastien Guerri
+#
+# This file is part of pbash.
+#
+# pbash is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# pbash is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Handle .pbashignore files (gitignore syntax)
+"""
+
+import os
+import re
+
+
+IGNORE_FILE = ".pbashignore"
+
+
+class IgnoreFile:
+    """Ignore file object
+    Compiled patterns of a .pbashignore file
+    """
+    base: str
+    patterns: list[tuple[re.Pattern, bool, bool]]
+
+    def __init__(self, base: str, content: str):
+        self.base = base
+        self.patterns = []
+        for line in content.splitlines():
+            line = line.rstrip()
+            if line == "" or line.startswith("#"):
+                continue
+            negate = line.startswith("!")
+            if negate:
+                line = line[1:]
+            dir_only = line.endswith("/")
+            line = line.rstrip("/")
+            if line == "":
+                continue
+            self.patterns.append((re.compile(ignore.translate(line)), negate, dir_only))
+
+    def match(self, rel: str, is_dir: bool) -> bool:
+        """Check a path against the patterns
+
+        Args:
+            rel (str): path relative to the ignore file directory
+            is_dir (bool): True if the path is a directory
+
+        Returns:
+            bool: True if ignored, False if explicitly included, None if no pattern matches
+        """
+        result = None
+        for (pattern, negate, dir_only) in self.patterns:
+            if dir_only and not is_dir:
+                continue
+            if pattern.match(rel):
+                result = not negate
+        return result
+
+
+class ignore:
+    """Static class for .pbashignore files
+    """
+
+    @staticmethod
+    def translate(pattern: str) -> str:
+        """Translate a gitignore pattern into a regular expression
+
+        Args:
+            pattern (str): gitignore pattern (without "!" and trailing "/")
+
+        Returns:
+            str: regular expression
+        """
+        # A pattern with a "/" is relative to the ignore file directory, otherwise it matches at any level
+        anchored = "/" in pattern
+        pattern = pattern.lstrip("/")
+        regex = ""
+        i = 0
+        while i < len(pattern):
+            c = pattern[i]
+            if pattern.startswith("**/", i):
+                regex += "(?:.*/)?"
+                i += 3
+                continue
+            if pattern.startswith("**", i):
+                regex += ".*"
+                i += 2
+                continue
+            if c == "*":
+                regex += "[^/]*"
+            elif c == "?":
+                regex += "[^/]"
+            elif c == "[" and "]" in pattern[i + 1:]:
+                end = pattern.index("]", i + 1)
+                chars = pattern[i + 1:end]
+                if chars.startswith("!"):
+                    chars = "^" + chars[1:]
+                regex += f"[{chars}]"
+                i = end
+            elif c == "\\" and i + 1 < len(pattern):
+                i += 1
+                regex += re.escape(pattern[i])
+            else:
+                regex += re.escape(c)
+            i += 1
+        if anchored:
+            return f"^{regex}$"
+        return f"^(?:.*/)?{regex}$"
+
+    @staticmethod
+    def load(root: str, base: str) -> IgnoreFile:
+        """Read and compile the ignore file of a directory
+
+        Args:
+            root (str): directory path
+            base (str): directory name, relative to the store
+
+        Returns:
+            IgnoreFile: compiled ignore file
+        """
+        with open(os.path.join(root, IGNORE_FILE), errors="replace") as f:
+            return IgnoreFile(base, f.read())
+
+    @staticmethod
+    def is_ignored(files: list[IgnoreFile], rel: str, is_dir: bool) -> bool:
+        """Check if a path is ignored
+        Ignore files are given from the store root to the deepest directory, the last matching pattern wins
+
+        Args:
+            files (list[IgnoreFile]): ignore files of the parent directories
+            rel (str): path relative to the store
+            is_dir (bool): True if the path is a directory
+
+        Returns:
+            bool: True if the path is ignored
+        """
+        ignored = False
+        for f in files:
+            result = f.match(rel[len(f.base) + 1:] if f.base != "" else rel, is_dir)
+            if result is not None:
+                ignored = result
+        return ignored
+
+    @staticmethod
+    def is_excluded(store: str, rel: str, loaded: dict[str, IgnoreFile]) -> bool:
+        """Check if a file is ignored without scanning the store: ignore files of its parent directories are read
+
+        Args:
+            store (str): store path
+            rel (str): file path relative to the store
+            loaded (dict[str, IgnoreFile]): ignore files already read, by directory (completed, None if no file)
+
+        Returns:
+            bool: True if the file or one of its parent directories is ignored
+        """
+        files: list[IgnoreFile] = []
+        parts = rel.split(os.sep)
+        for depth in range(len(parts)):
+            base = os.sep.join(parts[:depth])
+            if depth > 0 and ignore.is_ignored(files, base, True):
+                return True
+            if base not in loaded:
+                root = os.path.join(store, base)
+                loaded[base] = ignore.load(root, base) if os.path.isfile(os.path.join(root, IGNORE_FILE)) else None
+            if loaded[base] is not None:
+                files.append(loaded[base])
+        return ignore.is_ignored(files, rel, False)
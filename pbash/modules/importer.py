@@ -0,0 +1,182 @@
+# Copyright (C) 2022 Sebastien Guerri
+#
+# This file is part of pbash.
+#
+# pbash is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# pbash is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Import existing scripts in a store
+"""
+
+import os
+import re
+import stat
+import shlex
+from concurrent.futures import ThreadPoolExecutor
+
+from .commands import commands
+from .state import STATE_DIR
+
+
+IMPORT_WORKERS = 8
+
+SHEBANG = re.compile(r"^#!.*\b(ba)?sh\b")
+# read [options] name: prompt of -p is used as param message
+READ_LINE = re.compile(r"^\s*read\s+(.*)$")
+READ_OPTIONS_WITH_VALUE = ("-p", "-t", "-n", "-N", "-d", "-u", "-a", "-i")
+# pbash headers (#CACHE, #LOCK...) are not used as description
+HEADER = re.compile(r"^#[A-Z]+(\s|$)")
+
+
+class importer:
+    """Static class for importing scripts
+    """
+
+    @staticmethod
+    def is_script(path: str) -> bool:
+        """Check if a file is a shell script (.sh extension or shell shebang)
+
+        Args:
+            path (str): file path
+
+        Returns:
+            bool: True if the file is a shell script
+        """
+        if path.endswith(".sh"):
+            return True
+        try:
+            with open(path, "rb") as f:
+                return SHEBANG.match(f.readline(128).decode(errors="replace")) is not None
+        except OSError:
+            return False
+
+    @staticmethod
+    def detect_params(content: str) -> list[str]:
+        """Detect params from read lines (values are given on stdin when run by pbash)
+
+        Args:
+            content (str): script content
+
+        Returns:
+            list[str]: #PARAM values (name, message)
+        """
+        result: list[str] = []
+        for line in content.splitlines():
+            match = READ_LINE.match(line)
+            if match is None:
+                continue
+            try:
+                args = shlex.split(match.group(1).split(";")[0], comments=True)
+            except ValueError:
+                continue
+            message = ""
+            names: list[str] = []
+            i = 0
+            while i < len(args):
+                if args[i] == "-p" and i + 1 < len(args):
+                    message = args[i + 1].strip().rstrip(":?").strip()
+                if args[i] in READ_OPTIONS_WITH_VALUE:
+                    i += 2
+                    continue
+                if not args[i].startswith("-"):
+                    names.append(args[i])
+                i += 1
+            for name in names:
+                if re.match(r"^[A-Za-z_][A-Za-z0-9_]*$", name) and name not in [p.split(",")[0] for p in result]:
+                    result.append(f"{name}, {(message or name).replace(',', ' ')}")
+        return result
+
+    @staticmethod
+    def convert(content: str, name: str) -> str:
+        """Add missing #DESC and #PARAM headers to a script
+
+        Args:
+            content (str): script content
+            name (str): script name, used as default description
+
+        Returns:
+            str: converted content
+        """
+        lines = content.splitlines(keepends=True)
+        shebang = "#!/bin/bash"
+        if len(lines) > 0 and lines[0].startswith("#!"):
+            shebang = lines.pop(0).rstrip("\n")
+        body = "".join(lines)
+        has_desc = any(line.startswith("#DESC ") for line in lines)
+        has_param = any(line.startswith("#PARAM") for line in lines)
+        desc = ""
+        if not has_desc:
+            # First comment line of the script, or its name
+            comments = [line[1:].strip() for line in lines
+                        if line.startswith("#") and line[1:].strip() != "" and not HEADER.match(line)]
+            desc = comments[0] if len(comments) > 0 else name
+        param = [] if has_param else importer.detect_params(body)
+        return commands.header(shebang, desc, param) + body
+
+    @staticmethod
+    def copy(source: str, target: str) -> str:
+        """Import a script
+
+        Args:
+            source (str): script path
+            target (str): command file path in the store
+
+        Returns:
+            str: command file path
+        """
+        with open(source, errors="replace") as f:
+            content = f.read()
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, "w") as f:
+            f.write(importer.convert(content, os.path.basename(target).removesuffix(".sh")))
+        os.chmod(target, stat.S_IRWXU | stat.S_IRWXG | stat.S_IROTH | stat.S_IXOTH)
+        return target
+
+    @staticmethod
+    def run(source: str, store: str, force: bool = False,
+            workers: int = IMPORT_WORKERS) -> tuple[list[str], list[str]]:
+        """Import all scripts of a directory, keeping subfolders
+
+        Args:
+            source (str): directory path
+            store (str): store path
+            force (bool, optional): if True, existing command files are replaced. Defaults to False.
+            workers (int, optional): number of parallel copies. Defaults to IMPORT_WORKERS.
+
+        Returns:
+            tuple[list[str], list[str]]: imported command file paths, skipped (existing) command file paths
+        """
+        assert (os.path.isdir(source)), f"Path <{source}> is not a valid directory"
+        store_path = os.path.realpath(store)
+        copies: list[tuple[str, str]] = []
+        skipped: list[str] = []
+        targets: set[str] = set()
+        for (root, dirs, files) in os.walk(source):
+            dirs[:] = sorted(d for d in dirs
+                             if d not in (".git", STATE_DIR) and os.path.realpath(os.path.join(root, d)) != store_path)
+            for f in sorted(files):
+                path = os.path.join(root, f)
+                if not importer.is_script(path):
+                    continue
+                name = f if f.endswith(".sh") else f"{f}.sh"
+                target = os.path.join(store, os.path.relpath(root, source), name)
+                target = os.path.normpath(target)
+                if (os.path.exists(target) and not force) or target in targets:
+                    skipped.append(target)
+                    continue
+                targets.add(target)
+                copies.append((path, target))
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            imported = list(pool.map(lambda c: importer.copy(*c), copies))
+        return imported, skipped
@@ -0,0 +1,82 @@
+# Copyright (C) 2022 Sebastien Guerri
+#
+# This file is part of pbash.
+#
+# pbash is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# pbash is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Persisted catalog of a git store
+"""
+
+import os
+import json
+
+from .state import state, STATE_DIR
+from .fileio import fileio
+
+
+INDEX_FILE = "index.json"
+INDEX_VERSION = 1
+
+
+class index:
+    """Static class for persisted catalogs
+    Parsed command headers are saved for one commit. Files not matching this commit (uncommitted changes) are not
+    saved, they are listed separately.
+    """
+
+    @staticmethod
+    def exists(store: str) -> bool:
+        """Check if a store has a persisted catalog
+
+        Args:
+            store (str): store path
+
+        Returns:
+            bool: True if the catalog file exists
+        """
+        return os.path.isfile(os.path.join(store, STATE_DIR, INDEX_FILE))
+
+    @staticmethod
+    def load(store: str) -> dict:
+        """Read the persisted catalog of a store
+
+        Args:
+            store (str): store path
+
+        Returns:
+            dict: head (commit), dirty (paths not saved) and entries (parsed headers by path), None if missing
+        """
+        try:
+            with open(os.path.join(store, STATE_DIR, INDEX_FILE)) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(data, dict) or data.get("version") != INDEX_VERSION:
+            return None
+        return data
+
+    @staticmethod
+    def save(store: str, head: str, dirty: list[str], entries: dict[str, dict]):
+        """Write the persisted catalog of a store
+
+        Args:
+            store (str): store path
+            head (str): commit of the entries
+            dirty (list[str]): paths not matching the commit, not saved in entries
+            entries (dict[str, dict]): parsed headers by path relative to the store
+        """
+        path = state.path(store, INDEX_FILE)
+        with fileio.lock(path):
+            fileio.write(path, json.dumps({"version": INDEX_VERSION, "head": head, "dirty": dirty,
+                                           "entries": entries}))
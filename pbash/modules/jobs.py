@@ -0,0 +1,283 @@
+# Copyright (C) 2022 Sebastien Guerri
+#
+# This file is part of pbash.
+#
+# pbash is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# pbash is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Handle the persistent job queue
+"""
+
+import os
+import json
+import time
+import socket
+import sqlite3
+import threading
+
+from contextlib import closing
+from typing import Callable, Optional
+
+from .commands import CommandFile
+from .state import state
+
+
+JOBS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    path TEXT NOT NULL,
+    root_name TEXT,
+    name TEXT NOT NULL,
+    vals TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    submitted REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    code INTEGER,
+    worker TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id);
+"""
+
+
+class Job:
+    """Job object
+    """
+    id: int
+    path: str
+    root_name: str
+    name: str
+    values: list[str]
+    status: str
+    submitted: float
+    started: float
+    finished: float
+    code: int
+    worker: str
+    error: str
+
+    def __init__(self, row: sqlite3.Row):
+        self.id = row["id"]
+        self.path = row["path"]
+        self.root_name = row["root_name"] or ""
+        self.name = row["name"]
+        self.values = json.loads(row["vals"])
+        self.status = row["status"]
+        self.submitted = row["submitted"]
+        self.started = row["started"]
+        self.finished = row["finished"]
+        self.code = row["code"]
+        self.worker = row["worker"]
+        self.error = row["error"]
+
+
+class jobs:
+    """Static class for the job queue
+    """
+
+    @staticmethod
+    def connect(store: str) -> sqlite3.Connection:
+        """Open the job queue database
+
+        Args:
+            store (str): store path
+
+        Returns:
+            sqlite3.Connection: database connection
+        """
+        conn = sqlite3.connect(state.path(store, "queue.db"), timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(JOBS_SCHEMA)
+        if "root_name" not in [column["name"] for column in conn.execute("PRAGMA table_info(jobs)")]:
+            # Queue created by a previous version
+            try:
+                conn.execute("ALTER TABLE jobs ADD COLUMN root_name TEXT")
+            except sqlite3.OperationalError:
+                # Added meanwhile by another process
+                pass
+        return conn
+
+    @staticmethod
+    def submit(store: str, cmd: CommandFile, values: list[str]) -> int:
+        """Add a job to the queue
+
+        Args:
+            store (str): store path
+            cmd (CommandFile): command file
+            values (list[str]): resolved parameter values
+
+        Returns:
+            int: job id
+        """
+        # Workers run the recorded path: bundle scripts are extracted now
+        cmd.extract()
+        with closing(jobs.connect(store)) as conn:
+            # The folder name is kept: the path of an overlay, mirrored or bundle command is not in the store
+            cursor = conn.execute("INSERT INTO jobs (path, root_name, name, vals, submitted) VALUES (?, ?, ?, ?, ?)",
+                                  (cmd.path, cmd.root_name, cmd.f_name, json.dumps(values), time.time()))
+            return cursor.lastrowid
+
+    @staticmethod
+    def claim(conn: sqlite3.Connection, worker: str) -> Optional[Job]:
+        """Take the oldest queued job
+
+        Args:
+            conn (sqlite3.Connection): database connection
+            worker (str): worker id
+
+        Returns:
+            Job: claimed job, None if the queue is empty
+        """
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT * FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1").fetchone()
+            job = None
+            if row is not None:
+                conn.execute("UPDATE jobs SET status = 'running', started = ?, worker = ? WHERE id = ?",
+                             (time.time(), worker, row["id"]))
+                job = Job(conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone())
+        except BaseException:
+            # The job stays queued
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
+        return job
+
+    @staticmethod
+    def finish(conn: sqlite3.Connection, job: Job, code: int, error: str = ""):
+        """Save the result of a job
+
+        Args:
+            conn (sqlite3.Connection): database connection
+            job (Job): job
+            code (int): exit code
+            error (str, optional): error message. Defaults to "".
+        """
+        conn.execute("UPDATE jobs SET status = ?, finished = ?, code = ?, error = ? WHERE id = ?",
+                     ("done" if code == 0 and error == "" else "failed", time.time(), code, error, job.id))
+
+    @staticmethod
+    def recover(store: str) -> int:
+        """Requeue running jobs of workers which are no longer alive on this host
+
+        Args:
+            store (str): store path
+
+        Returns:
+            int: number of requeued jobs
+        """
+        host = socket.gethostname()
+        count = 0
+        with closing(jobs.connect(store)) as conn:
+            for row in conn.execute("SELECT id, worker FROM jobs WHERE status = 'running'").fetchall():
+                worker_host, _, pid = row["worker"].rpartition(":")
+                if worker_host != host:
+                    continue
+                try:
+                    os.kill(int(pid), 0)
+                except ProcessLookupError:
+                    conn.execute("UPDATE jobs SET status = 'queued', started = NULL, worker = NULL WHERE id = ?",
+                                 (row["id"],))
+                    count += 1
+                except PermissionError:
+                    pass
+        return count
+
+    @staticmethod
+    def work(store: str, run: Callable[[Job], int], threads: int = 1, once: bool = False,
+             poll: float = 1, stop: Optional[threading.Event] = None):
+        """Run queued jobs until stopped
+
+        Args:
+            store (str): store path
+            run (function): function running a job, returning its exit code
+            threads (int, optional): number of jobs run in parallel. Defaults to 1.
+            once (bool, optional): if True, stop when the queue is empty. Defaults to False.
+            poll (float, optional): delay between checks of an empty queue in seconds. Defaults to 1.
+            stop (threading.Event, optional): event stopping the workers. Defaults to None.
+        """
+        stop = stop or threading.Event()
+        worker = f"{socket.gethostname()}:{os.getpid()}"
+
+        def loop():
+            conn = jobs.connect(store)
+            while not stop.is_set():
+                job = jobs.claim(conn, worker)
+                if job is None:
+                    if once:
+                        break
+                    stop.wait(poll)
+                    continue
+                try:
+                    jobs.finish(conn, job, run(job))
+                except Exception as error:
+                    jobs.finish(conn, job, -1, str(error))
+            conn.close()
+
+        workers = [threading.Thread(target=loop, daemon=True) for _ in range(max(threads, 1))]
+        for thread in workers:
+            thread.start()
+        try:
+            for thread in workers:
+                while thread.is_alive():
+                    thread.join(0.5)
+        except KeyboardInterrupt:
+            # Running jobs are completed, no new job is claimed
+            stop.set()
+            for thread in workers:
+                thread.join()
+
+    @staticmethod
+    def get_list(store: str, status: str = "", limit: int = 20) -> list[Job]:
+        """Return the most recent jobs
+
+        Args:
+            store (str): store path
+            status (str, optional): status filter. Defaults to "".
+            limit (int, optional): maximum number of jobs. Defaults to 20.
+
+        Returns:
+            list[Job]: list of jobs, most recent first
+        """
+        with closing(jobs.connect(store)) as conn:
+            rows = conn.execute("SELECT * FROM jobs WHERE ? = '' OR status = ? ORDER BY id DESC LIMIT ?",
+                                (status, status, limit)).fetchall()
+        return list(map(Job, rows))
+
+    @staticmethod
+    def stats(store: str, period: float = 3600) -> dict:
+        """Return queue statistics
+
+        Args:
+            store (str): store path
+            period (float, optional): throughput period in seconds. Defaults to 3600.
+
+        Returns:
+            dict: number of jobs per status, jobs finished and failed during period, average duration
+        """
+        with closing(jobs.connect(store)) as conn:
+            counts = dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            row = conn.execute("SELECT COUNT(*), SUM(status = 'failed'), AVG(finished - started) FROM jobs "
+                               "WHERE finished >= ?", (time.time() - period,)).fetchone()
+        return {
+            "queued": counts.get("queued", 0),
+            "running": counts.get("running", 0),
+            "done": counts.get("done", 0),
+            "failed": counts.get("failed", 0),
+            "finished": row[0],
+            "finished_failed": row[1] or 0,
+            "duration": row[2] or 0,
+        }
@@ -0,0 +1,101 @@
+# Copyright (C) 2022 Sebastien Guerri
+#
+# This file is part of pbash.
+#
+# pbash is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# pbash is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Handle concurrency between runs of the same command
+"""
+
+import os
+import time
+import fcntl
+import hashlib
+
+from .commands import CommandFile, commands
+from .state import state
+
+
+LOCK_POLL_MIN = 0.05
+LOCK_POLL_MAX = 1.0
+
+
+class CommandLock:
+    """CommandLock object
+    One of the run slots of a command, held until released
+    """
+    fd: int
+
+    def __init__(self, fd: int):
+        self.fd = fd
+
+    def release(self):
+        """Release the slot
+        """
+        os.close(self.fd)
+
+
+class locks:
+    """Static class for command locks
+    """
+
+    @staticmethod
+    def try_acquire(store: str, cmd: CommandFile) -> CommandLock:
+        """Try to take a free run slot without waiting
+
+        Args:
+            store (str): store path
+            cmd (CommandFile): command file
+
+        Returns:
+            CommandLock: taken slot, None if all slots are used
+        """
+        # Named after the command name in the store, not its path (mirrors, bundles, mount points...)
+        name = hashlib.sha1(commands.key(cmd).encode()).hexdigest()[:16]
+        for index in range(cmd.max_concurrent):
+            fd = os.open(state.path(store, "locks", f"{name}.{index}"), os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return CommandLock(fd)
+            except BlockingIOError:
+                os.close(fd)
+        return None
+
+    @staticmethod
+    def acquire(store: str, cmd: CommandFile, wait: bool = True, timeout: float = 0) -> CommandLock:
+        """Take a run slot of a command
+
+        Args:
+            store (str): store path
+            cmd (CommandFile): command file
+            wait (bool, optional): if True, wait for a free slot. Defaults to True.
+            timeout (float, optional): maximum waiting time in seconds, 0 to wait forever. Defaults to 0.
+
+        Returns:
+            CommandLock: taken slot, None if no slot is available
+        """
+        lock = locks.try_acquire(store, cmd)
+        if lock is not None or not wait:
+            return lock
+        deadline = time.time() + timeout if timeout > 0 else None
+        delay = LOCK_POLL_MIN
+        while lock is None:
+            if deadline is not None:
+                if time.time() >= deadline:
+                    return None
+                delay = min(delay, deadline - time.time())
+            time.sleep(delay)
+            delay = min(delay * 2, LOCK_POLL_MAX)
+            lock = locks.try_acquire(store, cmd)
+        return lock
@@ -0,0 +1,234 @@
+# Copyright (C) 2022 Sebastien Guerri
+#
+# This file is part of pbash.
+#
+# pbash is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# pbash is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Handle command run logs
+"""
+
+import os
+import gzip
+import time
+
+from typing import BinaryIO
+
+from .commands import CommandFile
+from .state import state
+from .fileio import fileio
+
+
+LOG_MAX_SIZE = 100 * 1024 ** 2
+LOG_MAX_AGE = 30 * 86400
+LOG_SUFFIX = ".log.gz"
+# Minimum delay between two rotations in seconds
+LOG_ROTATE_INTERVAL = 300
+LOG_ROTATE_STAMP = ".rotated"
+
+
+class LogEntry:
+    """LogEntry object
+    Output sink compressing stdout and stderr of a command run
+    """
+    root: str
+    run_id: str
+    tmp_path: str
+    f: BinaryIO
+
+    def __init__(self, root: str):
+        self.root = root
+        # Unique per run: the same command may be run by several threads of a process
+        self.run_id = f"{os.getpid()}-{time.time_ns()}"
+        self.tmp_path = os.path.join(root, f".{self.run_id}.tmp")
+        self.f = gzip.open(self.tmp_path, "wb")
+
+    def write(self, stream: str, data: bytes):
+        self.f.write(data)
+
+    def close(self, started: float, duration: float, code: int) -> str:
+        """Save the log, named after the run start time, duration and exit code
+
+        Args:
+            started (float): start time
+            duration (float): duration in seconds
+            code (int): exit code
+
+        Returns:
+            str: log file path
+        """
+        self.f.close()
+        name = f"{time.strftime('%Y%m%dT%H%M%S', time.localtime(started))}-{self.run_id}"
+        path = os.path.join(self.root, f"{name}-{code}-{int(duration * 1000)}{LOG_SUFFIX}")
+        os.replace(self.tmp_path, path)
+        return path
+
+
+class LogFile:
+    """LogFile object
+    Information on a saved log, read from its name
+    """
+    path: str
+    started: float
+    code: int
+    duration: float
+    size: int
+
+    def __init__(self, path: str, size: int):
+        self.path = path
+        self.size = size
+        # date-pid-ns-code-duration (date-pid-code-duration for logs of previous versions)
+        fields = os.path.basename(path).removesuffix(LOG_SUFFIX).split("-")
+        if len(fields) not in (4, 5):
+            raise ValueError(f"Unknown log name <{path}>")
+        date, code, duration = fields[0], fields[-2], fields[-1]
+        self.started = time.mktime(time.strptime(date, "%Y%m%dT%H%M%S"))
+        self.code = int(code)
+        self.duration = int(duration) / 1000
+
+
+class logs:
+    """Static class for command run logs
+    """
+
+    @staticmethod
+    def root(store: str, cmd: CommandFile) -> str:
+        """Return the log directory of a command
+
+        Args:
+            store (str): store path
+            cmd (CommandFile): command file
+
+        Returns:
+            str: log directory
+        """
+        return os.path.dirname(state.path(store, "logs", cmd.root_name.strip("/"), cmd.f_name, ""))
+
+    @staticmethod
+    def entry(store: str, cmd: CommandFile) -> LogEntry:
+        """Create a new log entry
+
+        Args:
+            store (str): store path
+            cmd (CommandFile): command file
+
+        Returns:
+            LogEntry: log entry, to be used as an output sink
+        """
+        return LogEntry(logs.root(store, cmd))
+
+    @staticmethod
+    def get_list(store: str, cmd: CommandFile) -> list[LogFile]:
+        """Return the saved logs of a command, most recent first
+        Log files are not read
+
+        Args:
+            store (str): store path
+            cmd (CommandFile): command file
+
+        Returns:
+            list[LogFile]: list of logs
+        """
+        items: list[LogFile] = []
+        for item in os.scandir(logs.root(store, cmd)):
+            if item.is_file() and item.name.endswith(LOG_SUFFIX):
+                try:
+                    items.append(LogFile(item.path, item.stat().st_size))
+                except ValueError:
+                    # Skip unknown files
+                    continue
+        items.sort(key=lambda i: i.path, reverse=True)
+        return items
+
+    @staticmethod
+    def read(log: LogFile, out: BinaryIO):
+        """Write the content of a log
+
+        Args:
+            log (LogFile): saved log
+            out (BinaryIO): output stream
+        """
+        with gzip.open(log.path, "rb") as f:
+            while True:
+                data = f.read(65536)
+                if data == b"":
+                    break
+                out.write(data)
+
+    @staticmethod
+    def rotate(store: str, max_size: int = LOG_MAX_SIZE, max_age: int = LOG_MAX_AGE,
+               interval: int = LOG_ROTATE_INTERVAL):
+        """Remove logs older than max age, then oldest logs until total size is below max size
+        Logs are rotated by one process at a time, at most once per interval
+
+        Args:
+            store (str): store path
+            max_size (int, optional): maximum size of all logs in bytes. Defaults to LOG_MAX_SIZE.
+            max_age (int, optional): maximum age of logs in seconds. Defaults to LOG_MAX_AGE.
+            interval (int, optional): minimum delay since the last rotation in seconds. Defaults to
+                LOG_ROTATE_INTERVAL.
+        """
+        stamp = state.path(store, "logs", LOG_ROTATE_STAMP)
+
+        def is_recent() -> bool:
+            try:
+                return time.time() - os.stat(stamp).st_mtime < interval
+            except FileNotFoundError:
+                return False
+
+        if is_recent():
+            return
+        with fileio.lock(stamp):
+            if is_recent():
+                # Rotated by another process while waiting for the lock
+                return
+            logs.remove_old(os.path.dirname(stamp), max_size, max_age)
+            with open(stamp, "w"):
+                pass
+
+    @staticmethod
+    def remove_old(directory: str, max_size: int, max_age: int):
+        """Remove logs older than max age, then oldest logs until total size is below max size
+        Logs removed meanwhile (ex: by pbash logs) are skipped
+
+        Args:
+            directory (str): logs directory
+            max_size (int): maximum size of all logs in bytes
+            max_age (int): maximum age of logs in seconds
+        """
+        entries = []
+        total = 0
+        limit = time.time() - max_age
+        for (root, dirs, files) in os.walk(directory):
+            for f in files:
+                if not f.endswith(LOG_SUFFIX):
+                    continue
+                path = os.path.join(root, f)
+                try:
+                    stats = os.stat(path)
+                    if stats.st_mtime < limit:
+                        os.remove(path)
+                        continue
+                except FileNotFoundError:
+                    continue
+                entries.append((stats.st_mtime, stats.st_size, path))
+                total += stats.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
@@ -0,0 +1,275 @@
+# Copyright (C) 2022 Sebastien Guerri
+#
+# This file is part of pbash.
+#
+# pbash is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# pbash is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Keep run and scan metrics, exported in OpenMetrics / Prometheus text format
+"""
+
+import os
+import json
+import time
+import atexit
+import threading
+from typing import Callable
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from .state import state
+from .fileio import fileio
+
+
+# Histogram upper bounds in seconds
+RUN_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600)
+SCAN_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)
+
+OPENMETRICS_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+PROMETHEUS_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Observations are kept in memory and written at exit, or after this delay in long running processes (seconds)
+FLUSH_INTERVAL = 10
+
+# Pending updates by store
+PENDING: dict[str, list[Callable[[dict], None]]] = {}
+PENDING_LOCK = threading.Lock()
+FLUSH_STATE = {"registered": False, "flushed": time.time()}
+
+
+class metrics:
+    """Static class for metrics
+    """
+
+    @staticmethod
+    def load(store: str) -> dict:
+        """Read the metrics of a store
+
+        Args:
+            store (str): store path
+
+        Returns:
+            dict: metrics
+        """
+        try:
+            with open(state.path(store, "metrics.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"textfile": "", "runs": {}}
+
+    @staticmethod
+    def update(store: str, fn: Callable[[dict], None]):
+        """Update the metrics of a store
+        Updates are kept in memory and written once at exit (see flush), so observations cost nothing on the run
+        path. Long running processes (scheduler, worker) write them at most every FLUSH_INTERVAL.
+
+        Args:
+            store (str): store path
+            fn (Callable[[dict], None]): function modifying the metrics
+        """
+        with PENDING_LOCK:
+            if not FLUSH_STATE["registered"]:
+                atexit.register(metrics.flush)
+                FLUSH_STATE["registered"] = True
+            PENDING.setdefault(store, []).append(fn)
+            due = time.time() - FLUSH_STATE["flushed"] > FLUSH_INTERVAL
+        if due:
+            metrics.flush()
+
+    @staticmethod
+    def flush():
+        """Write pending updates, one locked read and write per store
+        """
+        with PENDING_LOCK:
+            pending = dict(PENDING)
+            PENDING.clear()
+            FLUSH_STATE["flushed"] = time.time()
+        for store, fns in pending.items():
+            try:
+                metrics.write(store, lambda data: [fn(data) for fn in fns])
+            except OSError:
+                # Metrics must never make a run fail
+                pass
+
+    @staticmethod
+    def write(store: str, fn: Callable[[dict], None]):
+        """Update the metrics of a store, raising errors
+        Updates are serialized with a lock and written with a rename, readers always see a complete file.
+        The textfile is rewritten if configured.
+
+        Args:
+            store (str): store path
+            fn (Callable[[dict], None]): function modifying the metrics
+        """
+        path = state.path(store, "metrics.json")
+        with fileio.lock(path):
+            data = metrics.load(store)
+            fn(data)
+            # Metrics are not worth a disk sync
+            fileio.write(path, json.dumps(data), False)
+            if data["textfile"] != "":
+                fileio.write(data["textfile"], metrics.render(data, False), False)
+
+    @staticmethod
+    def observe(histogram: dict, value: float, buckets: tuple):
+        """Add a value to a histogram
+
+        Args:
+            histogram (dict): histogram, created if empty
+            value (float): observed value
+            buckets (tuple): bucket upper bounds
+        """
+        if "buckets" not in histogram:
+            histogram["buckets"] = [0] * len(buckets)
+            histogram["sum"] = 0.0
+            histogram["count"] = 0
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                histogram["buckets"][i] += 1
+        histogram["sum"] += value
+        histogram["count"] += 1
+
+    @staticmethod
+    def observe_run(store: str, name: str, code: int, duration: float, cached: bool):
+        """Record a command run
+
+        Args:
+            store (str): store path
+            name (str): command name (ex: folder/name)
+            code (int): exit code
+            duration (float): duration in seconds
+            cached (bool): True if the output came from the cache
+        """
+        def fn(data: dict):
+            run = data["runs"].setdefault(name, {"codes": {}, "cached": 0, "duration": {}})
+            run["codes"][str(code)] = run["codes"].get(str(code), 0) + 1
+            if cached:
+                run["cached"] += 1
+            metrics.observe(run["duration"], duration, RUN_BUCKETS)
+        metrics.update(store, fn)
+
+    @staticmethod
+    def observe_scan(store: str, duration: float, files: int):
+        """Record a store scan
+
+        Args:
+            store (str): store path
+            duration (float): duration in seconds
+            files (int): number of parsed command files
+        """
+        def fn(data: dict):
+            data["files"] = data.get("files", 0) + files
+            metrics.observe(data.setdefault("scan", {}), duration, SCAN_BUCKETS)
+        metrics.update(store, fn)
+
+    @staticmethod
+    def observe_config(store: str, duration: float):
+        """Record a config file load
+
+        Args:
+            store (str): store path
+            duration (float): duration in seconds
+        """
+        metrics.update(store, lambda data: metrics.observe(data.setdefault("config", {}), duration, SCAN_BUCKETS))
+
+    @staticmethod
+    def set_textfile(store: str, path: str):
+        """Set the textfile written after each update (node exporter textfile collector)
+
+        Args:
+            store (str): store path
+            path (str): textfile path, empty to disable
+        """
+        if path != "":
+            path = os.path.abspath(path)
+            assert (path.endswith(".prom")), "Textfile name must end with .prom"
+            assert (os.path.isdir(os.path.dirname(path))), f"Directory <{os.path.dirname(path)}> does not exist"
+        metrics.write(store, lambda data: data.update({"textfile": path}))
+
+    @staticmethod
+    def render(data: dict, openmetrics: bool = True) -> str:
+        """Render metrics in text format
+
+        Args:
+            data (dict): metrics
+            openmetrics (bool, optional): if True OpenMetrics format, else Prometheus text format. Defaults to True.
+
+        Returns:
+            str: metrics in text format
+        """
+        lines: list[str] = []
+
+        def label(value: str) -> str:
+            return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+        def counter(name: str, help: str, samples: list[tuple[str, int]]):
+            lines.append(f"# TYPE {name if openmetrics else name + '_total'} counter")
+            lines.append(f"# HELP {name if openmetrics else name + '_total'} {help}")
+            for labels, value in samples:
+                lines.append(f"{name}_total{labels} {value}")
+
+        def histogram(name: str, help: str, samples: list[tuple[str, dict]], buckets: tuple):
+            lines.append(f"# TYPE {name} histogram")
+            lines.append(f"# HELP {name} {help}")
+            for labels, h in samples:
+                if "count" not in h:
+                    continue
+                prefix = labels[:-1] + "," if labels != "" else "{"
+                for bound, value in zip(buckets, h["buckets"]):
+                    lines.append(f"{name}_bucket{prefix}le=\"{float(bound)}\"}} {value}")
+                lines.append(f"{name}_bucket{prefix}le=\"+Inf\"}} {h['count']}")
+                lines.append(f"{name}_sum{labels} {h['sum']}")
+                lines.append(f"{name}_count{labels} {h['count']}")
+
+        runs = sorted(data["runs"].items())
+        counter("pbash_runs", "Command runs by exit code",
+                [(f"{{command=\"{label(n)}\",code=\"{c}\"}}", v)
+                 for n, r in runs for c, v in sorted(r["codes"].items())])
+        counter("pbash_cache_hits", "Command runs served from the cache",
+                [(f"{{command=\"{label(n)}\"}}", r["cached"]) for n, r in runs])
+        histogram("pbash_run_duration_seconds", "Command run duration",
+                  [(f"{{command=\"{label(n)}\"}}", r["duration"]) for n, r in runs], RUN_BUCKETS)
+        counter("pbash_scan_files", "Command files parsed by store scans", [("", data.get("files", 0))])
+        histogram("pbash_scan_duration_seconds", "Store scan duration", [("", data.get("scan", {}))], SCAN_BUCKETS)
+        histogram("pbash_config_load_duration_seconds", "Config file load duration",
+                  [("", data.get("config", {}))], SCAN_BUCKETS)
+        if openmetrics:
+            lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def serve(store: str, bind: str, port: int):
+        """Serve metrics over HTTP until interrupted
+
+        Args:
+            store (str): store path
+            bind (str): listening address
+            port (int): listening port
+        """
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                openmetrics = "application/openmetrics-text" in self.headers.get("Accept", "")
+                body = metrics.render(metrics.load(store), openmetrics).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", OPENMETRICS_TYPE if openmetrics else PROMETHEUS_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        with ThreadingHTTPServer((bind, port), MetricsHandler) as server:
+            server.serve_forever()
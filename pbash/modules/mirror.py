@@ -0,0 +1,200 @@
+# Copyright (C) 2022 Sebastien Guerri
+#
+# This file is part of pbash.
+#
+# pbash is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# pbash is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Keep a local mirror of a store (ex: store on a network filesystem)
+"""
+
+import os
+import json
+import time
+import shutil
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+from .state import state, STATE_DIR
+from .fileio import fileio
+from .ignore import ignore, IgnoreFile, IGNORE_FILE
+
+
+MANIFEST = ".pbash-mirror.json"
+MIRROR_WORKERS = 8
+# Files modified in place do not change the directory mtime: all files are compared after this delay (seconds)
+MIRROR_FULL_CHECK = 3600
+
+
+class mirror:
+    """Static class for local store mirrors
+    Directories are compared by mtime, only the files of changed directories are compared and copied
+    """
+
+    @staticmethod
+    def path(origin: str) -> str:
+        """Return the mirror directory of a store
+
+        Args:
+            origin (str): store path
+
+        Returns:
+            str: mirror path
+        """
+        return state.cache_path("mirror", hashlib.sha1(os.path.abspath(origin).encode()).hexdigest())
+
+    @staticmethod
+    def is_mirrored(name: str) -> bool:
+        """Check if a file is copied in the mirror
+
+        Args:
+            name (str): file name
+
+        Returns:
+            bool: True for command files and ignore files
+        """
+        return name.endswith(".sh") or name == IGNORE_FILE
+
+    @staticmethod
+    def copy(source: str, target: str):
+        """Copy a file, keeping mode and times, the target is replaced atomically
+
+        Args:
+            source (str): origin file path
+            target (str): mirror file path
+        """
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp_path = f"{target}.{os.getpid()}.tmp"
+        shutil.copy2(source, tmp_path)
+        os.replace(tmp_path, target)
+
+    @staticmethod
+    def is_current(origin: str, path: str) -> bool:
+        """Check if the mirror copy of a file is up to date
+        Copies keep the mtime of their origin file, so only the origin file is read from the store
+
+        Args:
+            origin (str): store path
+            path (str): file path in the store
+
+        Returns:
+            bool: True if the copy has the mtime and size of the origin file
+        """
+        try:
+            source = os.stat(path)
+            copy = os.stat(os.path.join(mirror.path(origin), os.path.relpath(path, origin)))
+        except FileNotFoundError:
+            return False
+        return source.st_mtime_ns == copy.st_mtime_ns and source.st_size == copy.st_size
+
+    @staticmethod
+    def sync(origin: str, full: bool = False) -> str:
+        """Update the mirror of a store
+        Only directories whose mtime changed are listed, and only new or changed files are copied
+
+        Args:
+            origin (str): store path
+            full (bool, optional): if True, files of unchanged directories are also compared. Defaults to False.
+
+        Returns:
+            str: mirror path
+        """
+        target = mirror.path(origin)
+        os.makedirs(target, exist_ok=True)
+        manifest_path = os.path.join(target, MANIFEST)
+        with fileio.lock(manifest_path):
+            try:
+                with open(manifest_path) as f:
+                    manifest = json.load(f)
+            except (OSError, ValueError):
+                manifest = {"checked": 0, "dirs": {}}
+            full = full or time.time() - manifest["checked"] > MIRROR_FULL_CHECK
+            old_dirs: dict = manifest["dirs"]
+            new_dirs: dict = {}
+            copies: list[tuple[str, str]] = []
+            removed: list[str] = []
+
+            # Directories to check, with the ignore files of their parents
+            pending: list[tuple[str, list[IgnoreFile]]] = [("", [])]
+            while len(pending) > 0:
+                rel, rules = pending.pop()
+                directory = os.path.join(origin, rel)
+                try:
+                    mtime = os.stat(directory).st_mtime_ns
+                except FileNotFoundError:
+                    continue
+                old = old_dirs.get(rel)
+                if old is not None and old["mtime"] == mtime and not full:
+                    # Unchanged directory: no listing, subdirectories are checked from the manifest
+                    new_dirs[rel] = old
+                    if IGNORE_FILE in old["files"] and os.path.isfile(os.path.join(target, rel, IGNORE_FILE)):
+                        rules = rules + [ignore.load(os.path.join(target, rel), rel)]
+                    pending.extend((os.path.join(rel, d), rules) for d in old["dirs"])
+                    continue
+                entry = {"mtime": mtime, "dirs": [], "files": {}}
+                with os.scandir(directory) as it:
+                    items = list(it)
+                if any(item.name == IGNORE_FILE and item.is_file() for item in items):
+                    rules = rules + [ignore.load(directory, rel)]
+                for item in items:
+                    # Ignored directories are never walked, ignored scripts are not copied (as for store scans)
+                    item_rel = os.path.join(rel, item.name)
+                    if item.is_dir():
+                        if item.name not in (".git", STATE_DIR) and not ignore.is_ignored(rules, item_rel, True):
+                            entry["dirs"].append(item.name)
+                    elif mirror.is_mirrored(item.name) and \
+                            (item.name == IGNORE_FILE or not ignore.is_ignored(rules, item_rel, False)):
+                        stat = item.stat()
+                        entry["files"][item.name] = [stat.st_mtime_ns, stat.st_size]
+                        old_file = None if old is None else old["files"].get(item.name)
+                        if old_file != entry["files"][item.name] or \
+                                not os.path.exists(os.path.join(target, rel, item.name)):
+                            copies.append((item.path, os.path.join(target, rel, item.name)))
+                if old is not None:
+                    removed.extend(os.path.join(rel, f) for f in old["files"] if f not in entry["files"])
+                new_dirs[rel] = entry
+                pending.extend((os.path.join(rel, d), rules) for d in entry["dirs"])
+
+            # Directories removed from origin
+            for rel in old_dirs:
+                if rel not in new_dirs:
+                    shutil.rmtree(os.path.join(target, rel), ignore_errors=True)
+            for rel in removed:
+                if os.path.exists(os.path.join(target, rel)):
+                    os.remove(os.path.join(target, rel))
+            if len(copies) > 0:
+                with ThreadPoolExecutor(max_workers=MIRROR_WORKERS) as pool:
+                    list(pool.map(lambda c: mirror.copy(*c), copies))
+
+            if full or new_dirs != old_dirs:
+                manifest = {"checked": time.time() if full else manifest["checked"], "dirs": new_dirs}
+                fileio.write(manifest_path, json.dumps(manifest))
+        return target
+
+    @staticmethod
+    def update(origin: str, paths: list[str]):
+        """Write through: update the mirror after files of the store were created, modified or deleted
+
+        Args:
+            origin (str): store path
+            paths (list[str]): modified file paths in the store
+        """
+        target = mirror.path(origin)
+        for path in paths:
+            rel = os.path.relpath(path, origin)
+            if os.path.exists(path):
+                mirror.copy(path, os.path.join(target, rel))
+            elif os.path.exists(os.path.join(target, rel)):
+                os.remove(os.path.join(target, rel))
+        # Directory mtimes changed
+        mirror.sync(origin)
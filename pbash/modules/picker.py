@@ -0,0 +1,186 @@
+# Copyright (C) 2022 Sebastien Guerri
+#
+# This file is part of pbash.
+#
+# pbash is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# pbash is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Interactive type-ahead picker
+"""
+
+import os
+import sys
+import tty
+import shutil
+import termios
+
+
+PICKER_HEIGHT = 15
+
+KEY_ENTER = ("\r", "\n")
+KEY_BACKSPACE = ("\x7f", "\x08")
+KEY_UP = ("\x1b[A", "\x1bOA", "\x10")      # arrow, arrow (application mode), ctrl-p
+KEY_DOWN = ("\x1b[B", "\x1bOB", "\x0e")    # arrow, arrow (application mode), ctrl-n
+KEY_CANCEL = ("\x1b", "\x03", "\x04")      # escape, ctrl-c, ctrl-d
+
+
+class Picker:
+    """Picker object
+    Narrows a list of entries as the user types, only the visible rows are drawn
+    """
+    labels: list[str]
+    haystacks: list[str]
+    query: str
+    history: list[list[int]]
+    selected: int
+    offset: int
+    height: int
+    drawn: int
+
+    def __init__(self, labels: list[str], height: int = PICKER_HEIGHT):
+        self.labels = labels
+        self.haystacks = [label.lower() for label in labels]
+        self.query = ""
+        # Matching indexes for each query length, a new char only filters the previous matches
+        self.history = [list(range(len(labels)))]
+        self.selected = 0
+        self.offset = 0
+        self.height = height
+        self.drawn = 0
+
+    @property
+    def matches(self) -> list[int]:
+        return self.history[-1]
+
+    def type(self, char: str):
+        """Add a char to the query
+
+        Args:
+            char (str): typed char
+        """
+        self.query += char
+        terms = self.query.lower().split()
+        self.history.append([i for i in self.matches if all(t in self.haystacks[i] for t in terms)])
+        self.selected = 0
+        self.offset = 0
+
+    def erase(self):
+        """Remove the last char of the query
+        """
+        if self.query == "":
+            return
+        self.query = self.query[:-1]
+        self.history.pop()
+        self.selected = 0
+        self.offset = 0
+
+    def move(self, step: int):
+        """Move the selection
+
+        Args:
+            step (int): number of rows (negative to move up)
+        """
+        if len(self.matches) == 0:
+            return
+        self.selected = max(0, min(len(self.matches) - 1, self.selected + step))
+        if self.selected < self.offset:
+            self.offset = self.selected
+        elif self.selected >= self.offset + self.height:
+            self.offset = self.selected - self.height + 1
+
+    def render(self, width: int) -> list[str]:
+        """Return the lines of the visible window
+
+        Args:
+            width (int): terminal width
+
+        Returns:
+            list[str]: prompt line followed by one line per visible row
+        """
+        lines = [f"\x1b[33m{len(self.matches)}/{len(self.labels)}\x1b[0m > {self.query}"[:width + 9]]
+        for i in range(self.offset, min(self.offset + self.height, len(self.matches))):
+            label = self.labels[self.matches[i]][:width - 2]
+            if i == self.selected:
+                lines.append(f"\x1b[7m> {label}\x1b[0m")
+            else:
+                lines.append(f"  {label}")
+        return lines
+
+    def draw(self, out):
+        """Draw the visible window, replacing the previous one
+
+        Args:
+            out: output stream
+        """
+        width = shutil.get_terminal_size().columns
+        lines = self.render(width)
+        # Always draw the same number of lines, the window does not move while typing
+        lines += [""] * (self.height + 1 - len(lines))
+        buffer = f"\x1b[{self.drawn}F" if self.drawn > 0 else ""
+        buffer += "".join(f"\x1b[2K{line}\n" for line in lines)
+        out.write(buffer)
+        out.flush()
+        self.drawn = len(lines)
+
+    def clear(self, out):
+        """Remove the window from the terminal
+
+        Args:
+            out: output stream
+        """
+        if self.drawn > 0:
+            out.write(f"\x1b[{self.drawn}F\x1b[J")
+            out.flush()
+        self.drawn = 0
+
+    def select(self) -> int:
+        """Run the picker on the terminal
+
+        Returns:
+            int: index of the selected entry, None if cancelled
+        """
+        fd = sys.stdin.fileno()
+        out = sys.stdout
+        attributes = termios.tcgetattr(fd)
+        self.height = max(1, min(self.height, len(self.labels), shutil.get_terminal_size().lines - 2))
+        try:
+            tty.setcbreak(fd)
+            self.draw(out)
+            while True:
+                key = os.read(fd, 32).decode(errors="ignore")
+                if key in KEY_ENTER:
+                    if len(self.matches) > 0:
+                        return self.matches[self.selected]
+                elif key in KEY_CANCEL:
+                    return None
+                elif key in KEY_BACKSPACE:
+                    self.erase()
+                elif key in KEY_UP:
+                    self.move(-1)
+                elif key in KEY_DOWN:
+                    self.move(1)
+                elif key == "\x1b[5~":
+                    self.move(-self.height)
+                elif key == "\x1b[6~":
+                    self.move(self.height)
+                else:
+                    # Pasted text is read at once
+                    for char in key:
+                        if char.isprintable():
+                            self.type(char)
+                self.draw(out)
+        except KeyboardInterrupt:
+            return None
+        finally:
+            self.clear(out)
+            termios.tcsetattr(fd, termios.TCSADRAIN, attributes)
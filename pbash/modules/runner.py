@@ -0,0 +1,470 @@
+# Copyright (C) 2022 Sebastien Guerri
+#
+# This file is part of pbash.
+#
+# pbash is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# pbash is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Handle command files execution
+"""
+
+import os
+import sys
+import errno
+import time
+import signal
+import selectors
+import threading
+import subprocess
+
+from typing import Callable, Optional
+
+from .commands import commands, CommandFile, CommandFileParam
+from .cache import cache
+from .locks import locks
+from .logs import logs
+from .metrics import metrics
+from .defaults import defaults
+
+
+OUTPUT_BUFFER_SIZE = 65536
+TIMEOUT_GRACE = 5
+TIMEOUT_EXIT_CODE = 124
+
+
+class RunResult:
+    """RunResult object
+    """
+    code: int
+    started: float
+    duration: float
+    reason: str
+    cached: bool
+    skipped: bool
+    stdout: bytes
+    stderr: bytes
+
+    def __init__(self, code: int, started: float, duration: float, reason: str = "",
+                 cached: bool = False, skipped: bool = False):
+        self.code = code
+        self.started = started
+        self.duration = duration
+        self.reason = reason
+        self.cached = cached
+        self.skipped = skipped
+        self.stdout = b""
+        self.stderr = b""
+
+
+class TerminalOutput:
+    """TerminalOutput object
+    Output sink passing command output through to the terminal
+    """
+
+    def write(self, stream: str, data: bytes):
+        terminal = sys.stdout.buffer if stream == "stdout" else sys.stderr.buffer
+        terminal.write(data)
+        terminal.flush()
+
+
+class BufferOutput:
+    """BufferOutput object
+    Output sink keeping command output in memory
+    """
+    stdout: bytearray
+    stderr: bytearray
+
+    def __init__(self):
+        self.stdout = bytearray()
+        self.stderr = bytearray()
+
+    def write(self, stream: str, data: bytes):
+        if stream == "stdout":
+            self.stdout += data
+        else:
+            self.stderr += data
+
+
+class runner:
+    """Static class for running command files
+    """
+
+    @staticmethod
+    def resolve(cmd: CommandFile,
+                stdin_values: list[str],
+                options: dict[str, str],
+                ask: Optional[Callable[[CommandFileParam, str], str]] = None,
+                store: str = "") -> list[str]:
+        """Resolve the value of each command parameter
+        Values are taken from stdin first, then from options, then prompted.
+        Dynamic defaults ($(cmd)) are evaluated concurrently before prompting.
+
+        Args:
+            cmd (CommandFile): command file
+            stdin_values (list[str]): values read from stdin
+            options (dict[str, str]): values given as options
+            ask (function, optional): prompt callback, with the param and its default value. If None, parameters are
+                never prompted. Defaults to None.
+            store (str, optional): store path, used to cache dynamic defaults. Defaults to "" (no cache).
+
+        Returns:
+            list[str]: parameter values
+        """
+        # Only dynamic defaults which are used are evaluated
+        needed = [p for i, p in enumerate(cmd.params)
+                  if p.dynamic and (i >= len(stdin_values) or stdin_values[i] == "")
+                  and options.get(p.name, p.default) == p.default]
+        evaluated = defaults.get(store, needed)
+
+        values: list[str] = []
+        index = 0
+        for param in cmd.params:
+            default = evaluated.get(param.name, param.default)
+            value = ""
+            if index < len(stdin_values):
+                value = stdin_values[index]
+            index += 1
+            if value == "":
+                value = options.get(param.name, param.default)
+                if value == param.default:
+                    value = default
+                    if param.ask_always and ask is not None:
+                        value = ask(param, default)
+            if value == "" and ask is not None:
+                value = ask(param, default)
+            assert (value != ""), f"Value for <{param.name}> must not be empty"
+            values.append(value)
+        return values
+
+    @staticmethod
+    def run(store: str,
+            cmd: CommandFile,
+            values: list[str],
+            no_cache: bool = False,
+            busy: str = "wait",
+            wait_timeout: float = 0,
+            log: bool = False,
+            capture: bool = False,
+            passthrough: bool = True) -> RunResult:
+        """Run a command file, handling #CACHE, #MAXCONCURRENT and #LOG headers
+
+        Args:
+            store (str): store path
+            cmd (CommandFile): command file
+            values (list[str]): parameter values
+            no_cache (bool, optional): if True, cached output is not used. Defaults to False.
+            busy (str, optional): wait, fail or skip when all run slots are used. Defaults to "wait".
+            wait_timeout (float, optional): maximum waiting time for a run slot, 0 for no limit. Defaults to 0.
+            log (bool, optional): if True, output is saved in a log even without #LOG header. Defaults to False.
+            capture (bool, optional): if True, output is returned in the result. Defaults to False.
+            passthrough (bool, optional): if False, captured output is not displayed. Defaults to True.
+
+        Returns:
+            RunResult: execution result
+        """
+        started = time.time()
+        cmd.extract()
+        buffer = BufferOutput() if capture else None
+        key = None
+        if cmd.cache_ttl > 0:
+            key = cache.key(cmd, values)
+            outputs = [s for s in [TerminalOutput() if passthrough else None, buffer] if s is not None]
+            code = None if no_cache else cache.stream(store, key, cmd.cache_ttl, outputs)
+            if code is not None:
+                result = RunResult(code, started, time.time() - started, cached=True)
+                if buffer is not None:
+                    result.stdout = bytes(buffer.stdout)
+                metrics.observe_run(store, commands.key(cmd), result.code, result.duration, True)
+                return result
+
+        lock = None
+        if cmd.max_concurrent > 0:
+            lock = locks.acquire(store, cmd, busy == "wait", wait_timeout)
+            if lock is None and busy == "skip":
+                return RunResult(0, started, time.time() - started, skipped=True)
+            assert (lock is not None), f"Command <{cmd.f_name}> is already running"
+
+        cache_entry = None if key is None else cache.entry(store, key)
+        log_entry = logs.entry(store, cmd) if log or cmd.log else None
+        sinks = [s for s in [buffer, cache_entry, log_entry] if s is not None]
+        if len(sinks) > 0 and passthrough:
+            sinks.insert(0, TerminalOutput())
+        try:
+            result = runner.execute(cmd, values, sinks)
+        finally:
+            if lock is not None:
+                lock.release()
+
+        if buffer is not None:
+            result.stdout = bytes(buffer.stdout)
+            result.stderr = bytes(buffer.stderr)
+        if cache_entry is not None:
+            if result.reason == "":
+                cache_entry.close(result.code)
+            else:
+                # Runs stopped by a limit are not cached
+                cache_entry.discard()
+            cache.evict(store)
+        if log_entry is not None:
+            log_entry.close(result.started, result.duration, result.code)
+            logs.rotate(store)
+        metrics.observe_run(store, commands.key(cmd), result.code, result.duration, False)
+        return result
+
+    @staticmethod
+    def command(cmd: CommandFile, shell: bool = False) -> list[str]:
+        """Return the arguments running a command file with its limits
+        Limits are set by a bash wrapper which then execs the script: no Python code runs in the child process
+        between fork and exec, which is not safe when threads are running
+
+        Args:
+            cmd (CommandFile): command file
+            shell (bool, optional): run the script with sh, for scripts without a shebang. Defaults to False.
+
+        Returns:
+            list[str]: process arguments
+        """
+        if cmd.maxmem == 0 and cmd.maxcpu == 0 and cmd.nice == 0:
+            return ["/bin/sh", cmd.path] if shell else [cmd.path]
+        steps: list[str] = []
+        if cmd.maxmem > 0:
+            steps.append(f"ulimit -v {max(cmd.maxmem // 1024, 1)}")
+        if cmd.maxcpu > 0:
+            # SIGXCPU at soft limit, SIGKILL at hard limit
+            steps.append(f"ulimit -S -t {cmd.maxcpu}")
+            steps.append(f"ulimit -H -t {cmd.maxcpu + 1}")
+        steps.append(f"exec nice -n {cmd.nice} \"$0\"" if cmd.nice != 0 else "exec \"$0\"")
+        return ["bash", "-c", " && ".join(steps), cmd.path]
+
+    @staticmethod
+    def spawn(cmd: CommandFile, **kwargs) -> subprocess.Popen:
+        """Start a command file with its limits
+        The script is run with sh when it cannot be executed directly (no shebang), as os.system did
+
+        Args:
+            cmd (CommandFile): command file
+            kwargs: Popen keyword arguments
+
+        Returns:
+            subprocess.Popen: running process
+        """
+        try:
+            return subprocess.Popen(runner.command(cmd), **kwargs)
+        except OSError as error:
+            if error.errno != errno.ENOEXEC:
+                raise
+            return subprocess.Popen(runner.command(cmd, shell=True), **kwargs)
+
+    @staticmethod
+    def group() -> dict:
+        """Return the Popen arguments starting a script in its own process group, so that the whole group can be
+        killed on timeout
+
+        Returns:
+            dict: Popen keyword arguments
+        """
+        if sys.version_info >= (3, 11):
+            return {"process_group": 0}
+        # No process_group argument: a new session also creates a new group
+        return {"start_new_session": True}
+
+    @staticmethod
+    def terminal() -> Optional[int]:
+        """Return the terminal to hand over to a script run in its own process group
+        A background process group reading the terminal would be stopped (SIGTTIN)
+
+        Returns:
+            int: terminal file descriptor, None if pbash is not run in the foreground of a terminal, or not from the
+            main thread (parallel runs)
+        """
+        if sys.version_info < (3, 11) or threading.current_thread() is not threading.main_thread():
+            return None
+        try:
+            fd = sys.stdin.fileno()
+            if os.isatty(fd) and os.tcgetpgrp(fd) == os.getpgrp():
+                return fd
+        except (OSError, ValueError, AttributeError):
+            pass
+        return None
+
+    @staticmethod
+    def foreground(fd: int, pgid: int):
+        """Set the foreground process group of a terminal
+
+        Args:
+            fd (int): terminal file descriptor
+            pgid (int): process group
+        """
+        # pbash may be in the background when the terminal is given back
+        handler = signal.signal(signal.SIGTTOU, signal.SIG_IGN)
+        try:
+            os.tcsetpgrp(fd, pgid)
+        except OSError:
+            pass
+        finally:
+            signal.signal(signal.SIGTTOU, handler)
+
+    @staticmethod
+    def execute(cmd: CommandFile, values: list[str], sinks: Optional[list] = None) -> RunResult:
+        """Execute a command file
+        When sinks are given, stdout and stderr are copied to each sink as soon as they are read
+
+        Args:
+            cmd (CommandFile): command file
+            values (list[str]): parameter values, sent to the script stdin
+            sinks (list, optional): objects with a write(stream: str, data: bytes) method. Defaults to None.
+
+        Returns:
+            RunResult: execution result
+        """
+        started = time.time()
+        sinks = sinks or []
+        capture = len(sinks) > 0
+        terminal = runner.terminal() if cmd.timeout > 0 else None
+        process = runner.spawn(cmd,
+                               stdin=subprocess.PIPE if len(cmd.params) > 0 else None,
+                               stdout=subprocess.PIPE if capture else None,
+                               stderr=subprocess.PIPE if capture else None,
+                               **(runner.group() if cmd.timeout > 0 else {}))
+        if terminal is not None:
+            runner.foreground(terminal, process.pid)
+            # The script may have been stopped by reading the terminal before getting it
+            runner.kill(process, signal.SIGCONT)
+        try:
+            code, reason = runner.wait(cmd, process, values, capture, sinks, started)
+        finally:
+            if terminal is not None:
+                runner.foreground(terminal, os.getpgrp())
+        return RunResult(code, started, time.time() - started, reason)
+
+    @staticmethod
+    def wait(cmd: CommandFile, process: subprocess.Popen, values: list[str], capture: bool, sinks: list,
+             started: float) -> tuple[int, str]:
+        """Send parameter values to a running script, copy its outputs and wait for its end, handling #TIMEOUT
+
+        Args:
+            cmd (CommandFile): command file
+            process (subprocess.Popen): running process
+            values (list[str]): parameter values, sent to the script stdin
+            capture (bool): True if outputs are piped
+            sinks (list): objects with a write(stream: str, data: bytes) method
+            started (float): start time
+
+        Returns:
+            tuple[int, str]: exit code, limit header (empty if no limit was reached)
+        """
+        if len(cmd.params) > 0:
+            try:
+                process.stdin.write("".join(map(lambda v: f"{v}\n", values)).encode())
+                process.stdin.close()
+            except BrokenPipeError:
+                pass
+
+        selector = None
+        if capture:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            selector = selectors.DefaultSelector()
+            selector.register(process.stdout, selectors.EVENT_READ, "stdout")
+            selector.register(process.stderr, selectors.EVENT_READ, "stderr")
+
+        deadline = started + cmd.timeout if cmd.timeout > 0 else None
+        timed_out = False
+        while True:
+            try:
+                if capture and runner.pump(selector, sinks, deadline):
+                    process.wait()
+                    break
+                if not capture:
+                    process.wait(None if deadline is None else max(deadline - time.time(), 0))
+                    break
+            except subprocess.TimeoutExpired:
+                pass
+            except KeyboardInterrupt:
+                # The script decides when to stop
+                if cmd.timeout > 0:
+                    runner.kill(process, signal.SIGINT)
+                continue
+            # Timeout: terminate the whole group, then kill it after a grace delay
+            timed_out = True
+            deadline = None
+            runner.kill(process, signal.SIGTERM)
+            try:
+                process.wait(TIMEOUT_GRACE)
+            except subprocess.TimeoutExpired:
+                runner.kill(process, signal.SIGKILL)
+        if capture:
+            selector.close()
+            process.stdout.close()
+            process.stderr.close()
+
+        return runner.status(cmd, process.returncode, timed_out)
+
+    @staticmethod
+    def status(cmd: CommandFile, returncode: int, timed_out: bool) -> tuple[int, str]:
+        """Return the exit code of a script and the limit which stopped it
+
+        Args:
+            cmd (CommandFile): command file
+            returncode (int): process return code, negative when killed by a signal
+            timed_out (bool): True if the script was stopped by #TIMEOUT
+
+        Returns:
+            tuple[int, str]: exit code, limit header (empty if no limit was reached)
+        """
+        code = returncode if returncode >= 0 else 128 - returncode
+        if timed_out:
+            return TIMEOUT_EXIT_CODE, f"#TIMEOUT {cmd.timeout}s"
+        if cmd.maxcpu > 0 and returncode in [-signal.SIGXCPU, -signal.SIGKILL]:
+            return code, f"#MAXCPU {cmd.maxcpu}s"
+        if cmd.maxmem > 0 and returncode in [-signal.SIGSEGV, -signal.SIGABRT, -signal.SIGKILL]:
+            return code, f"#MAXMEM {cmd.maxmem} bytes"
+        return code, ""
+
+    @staticmethod
+    def kill(process: subprocess.Popen, sig: int):
+        """Send a signal to the process group of a script
+
+        Args:
+            process (subprocess.Popen): running process
+            sig (int): signal
+        """
+        try:
+            os.killpg(process.pid, sig)
+        except ProcessLookupError:
+            pass
+
+    @staticmethod
+    def pump(selector: selectors.BaseSelector, sinks: list, deadline: Optional[float] = None) -> bool:
+        """Copy process outputs to sinks until they are closed
+
+        Args:
+            selector (selectors.BaseSelector): selector on process outputs
+            sinks (list): objects with a write(stream: str, data: bytes) method
+            deadline (float, optional): time when copy stops. Defaults to None.
+
+        Returns:
+            bool: True if outputs are closed, False if deadline is reached
+        """
+        while len(selector.get_map()) > 0:
+            timeout = None if deadline is None else deadline - time.time()
+            if timeout is not None and timeout <= 0:
+                return False
+            for key, _ in selector.select(timeout):
+                data = os.read(key.fd, OUTPUT_BUFFER_SIZE)
+                if data == b"":
+                    selector.unregister(key.fileobj)
+                    continue
+                for sink in sinks:
+                    sink.write(key.data, data)
+        return True
@@ -0,0 +1,291 @@
+# Copyright (C) 2022 Sebastien Guerri
+#
+# This file is part of pbash.
+#
+# pbash is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# pbash is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Handle scheduled commands
+"""
+
+import os
+import json
+import heapq
+import threading
+
+from datetime import datetime
+from typing import Callable, Optional
+
+from .commands import CommandFile, commands
+from .cron import CronExpr
+from .state import state
+from .fileio import fileio
+from .ui import ui
+
+
+SCHEDULER_CATCH_UP_MAX = 100
+
+
+class ScheduledCommand:
+    """ScheduledCommand object
+    """
+    cmd: CommandFile
+    cron: CronExpr
+    running: int
+    pending: int
+
+    def __init__(self, cmd: CommandFile):
+        self.cmd = cmd
+        self.cron = CronExpr(cmd.schedule)
+        self.running = 0
+        self.pending = 0
+
+
+class Scheduler:
+    """Scheduler object
+    Keeps the catalog of scheduled commands in memory and fires them from a timer heap.
+    Commands are identified by their name relative to their root (see commands.key).
+    """
+    store: str
+    roots: list[str]
+    mirrored: bool
+    run: Callable[[CommandFile], int]
+    overlap: str
+    catch_up: str
+    reload_delay: float
+    items: dict[str, ScheduledCommand]
+    parsed: dict[str, dict]
+    ignored: dict[str, str]
+    heap: list[tuple[datetime, str]]
+    next_runs: dict[str, datetime]
+    last_runs: dict[str, float]
+
+    def __init__(self, store: str, run: Callable[[CommandFile], int], overlap: str = "skip",
+                 catch_up: str = "none", reload_delay: float = 30, roots: Optional[list[str]] = None,
+                 mirrored: bool = False):
+        """Init class
+
+        Args:
+            store (str): store path
+            run (function): function running a command, returning its exit code
+            overlap (str, optional): skip, queue or parallel, when a command is still running. Defaults to "skip".
+            catch_up (str, optional): none, once or all, for runs missed while stopped. Defaults to "none".
+            reload_delay (float, optional): delay between checks of command changes in seconds. Defaults to 30.
+            roots (list[str], optional): store and overlay paths (see Config.roots). Defaults to the store only.
+            mirrored (bool, optional): if True, roots are read from their local mirror. Defaults to False.
+        """
+        self.store = store
+        self.roots = roots or [store]
+        self.mirrored = mirrored
+        self.run = run
+        self.overlap = overlap
+        self.catch_up = catch_up
+        self.reload_delay = reload_delay
+        self.items = {}
+        # Parsed command files by root, with their mtime and size
+        self.parsed = {}
+        self.ignored = {}
+        self.heap = []
+        self.next_runs = {}
+        self.lock = threading.Lock()
+        self.stop = threading.Event()
+        self.state_path = state.path(store, "scheduler.json")
+        self.last_runs = {}
+        if os.path.exists(self.state_path):
+            with open(self.state_path) as f:
+                self.last_runs = json.load(f)
+
+    def reload(self) -> list[str]:
+        """Update the catalog from the store and its overlays, only parsing files which changed since last reload
+        When the store cannot be read, the current catalog is kept
+
+        Returns:
+            list[str]: names of added, updated or removed scheduled commands
+        """
+        try:
+            catalog = commands.get_catalog(self.roots, mirrored=self.mirrored, parsed=self.parsed)
+        except (AssertionError, ValueError, OSError, UnicodeDecodeError) as error:
+            self.notify(self.store, f"reload failed: {error}")
+            return []
+        changed: list[str] = []
+        names: set[str] = set()
+        for cmd in catalog.items:
+            if cmd.schedule == "":
+                continue
+            name = commands.key(cmd)
+            names.add(name)
+            previous = self.items.get(name)
+            if previous is not None and previous.cmd is cmd:
+                # Not parsed again
+                continue
+            if self.ignored.get(name) == cmd.schedule:
+                continue
+            try:
+                item = ScheduledCommand(cmd)
+            except (AssertionError, ValueError) as error:
+                self.ignore(name, cmd.schedule, error)
+                if previous is not None:
+                    changed.append(name)
+                continue
+            if previous is not None:
+                item.running = previous.running
+                item.pending = previous.pending
+                if previous.cron.expr == item.cron.expr:
+                    self.items[name] = item
+                    continue
+            self.items[name] = item
+            try:
+                self.plan(name)
+            except AssertionError as error:
+                # Expression which never matches (ex: 0 0 30 2 *)
+                self.ignore(name, cmd.schedule, error)
+                if previous is None:
+                    continue
+            changed.append(name)
+        for name in list(self.items.keys()):
+            if name not in names:
+                del self.items[name]
+                self.next_runs.pop(name, None)
+                changed.append(name)
+        self.ignored = {name: expr for name, expr in self.ignored.items() if name in names}
+        return changed
+
+    def ignore(self, name: str, expr: str, error: Exception):
+        """Remove a command whose schedule cannot be used, it is reported once per expression
+
+        Args:
+            name (str): command name
+            expr (str): schedule expression
+            error (Exception): error
+        """
+        self.notify(name, f"ignored: {error}")
+        self.ignored[name] = expr
+        if self.items.pop(name, None) is not None:
+            self.next_runs.pop(name, None)
+
+    def plan(self, name: str):
+        """Add the next run of a command to the heap
+        With catch-up, the next run is searched from the last known run, so missed runs are due immediately
+
+        Args:
+            name (str): command name
+        """
+        after = datetime.now()
+        last = self.last_runs.get(name)
+        if last is not None and self.catch_up != "none":
+            after = min(after, datetime.fromtimestamp(last))
+        self.push(name, self.items[name].cron.next(after))
+
+    def push(self, name: str, when: datetime):
+        """Add a run to the heap, replacing any previous run of the same command
+
+        Args:
+            name (str): command name
+            when (datetime): run time
+        """
+        self.next_runs[name] = when
+        heapq.heappush(self.heap, (when, name))
+
+    def due(self, now: datetime) -> list[str]:
+        """Pop all due runs from the heap
+
+        Args:
+            now (datetime): current time
+
+        Returns:
+            list[str]: names of commands to run
+        """
+        names: list[str] = []
+        while len(self.heap) > 0 and self.heap[0][0] <= now:
+            when, name = heapq.heappop(self.heap)
+            if self.next_runs.get(name) != when:
+                # Command removed or rescheduled
+                continue
+            item = self.items[name]
+            missed = 0
+            next_time = item.cron.next(when)
+            while next_time <= now and missed < SCHEDULER_CATCH_UP_MAX:
+                missed += 1
+                next_time = item.cron.next(next_time)
+            self.push(name, next_time)
+            names += [name] * (1 + (missed if self.catch_up == "all" else 0))
+        return names
+
+    def fire(self, name: str):
+        """Run a command in a thread, following the overlap policy
+
+        Args:
+            name (str): command name
+        """
+        item = self.items[name]
+        with self.lock:
+            self.last_runs[name] = datetime.now().timestamp()
+            self.save()
+            if item.running > 0 and self.overlap == "skip":
+                self.notify(name, "skipped, still running")
+                return
+            if item.running > 0 and self.overlap == "queue":
+                item.pending += 1
+                self.notify(name, "queued, still running")
+                return
+            item.running += 1
+        threading.Thread(target=self.execute, args=(item,), daemon=True).start()
+
+    def execute(self, item: ScheduledCommand):
+        """Run a command, then its queued runs
+
+        Args:
+            item (ScheduledCommand): scheduled command
+        """
+        name = commands.key(item.cmd)
+        while True:
+            self.notify(name, "started")
+            try:
+                code = self.run(item.cmd)
+                self.notify(name, f"finished with exit code {code}")
+            except Exception as error:
+                self.notify(name, f"failed: {error}")
+            with self.lock:
+                if item.pending == 0:
+                    item.running -= 1
+                    return
+                item.pending -= 1
+
+    def save(self):
+        """Save the last run times, used for catch-up
+        """
+        with fileio.lock(self.state_path):
+            fileio.write(self.state_path, json.dumps(self.last_runs))
+
+    def notify(self, name: str, message: str):
+        """Display a scheduler event
+
+        Args:
+            name (str): command name (or store path)
+            message (str): event
+        """
+        ui.print_info(f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} <{name}> {message}")
+
+    def loop(self):
+        """Run the scheduler until stopped
+        """
+        next_reload = datetime.now()
+        while not self.stop.is_set():
+            now = datetime.now()
+            if now >= next_reload:
+                self.reload()
+                next_reload = datetime.fromtimestamp(now.timestamp() + self.reload_delay)
+            for path in self.due(now):
+                self.fire(path)
+            wake = next_reload if len(self.heap) == 0 else min(next_reload, self.heap[0][0])
+            self.stop.wait(max((wake - datetime.now()).total_seconds(), 0.1))
@@ -0,0 +1,227 @@
+# Copyright (C) 2022 Sebastien Guerri
+#
+# This file is part of pbash.
+#
+# pbash is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# pbash is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Generate bash shims for command files
+"""
+
+import os
+import stat
+import shlex
+import shutil
+
+from .commands import CommandFile, commands
+
+
+SHIM_MARKER = "# Generated by pbash shims - do not edit"
+
+SHIM_TEMPLATE = """#!/bin/bash
+{marker}
+# source: {path}
+names=({names})
+messages=({messages})
+defaults=({defaults})
+always=({always})
+
+stdin_values=()
+if [ -p /dev/stdin ] || [ -f /dev/stdin ]; then
+    # Piped values come first
+    mapfile -t stdin_values
+fi
+
+declare -A flags
+while [ $# -gt 0 ]; do
+    case "$1" in
+        --*=*) key="${{1%%=*}}"; key="${{key#--}}"; value="${{1#*=}}" ;;
+        --*) key="${{1#--}}"; value="$2"; shift ;;
+        *) echo "ERROR: Unknown argument <$1>" >&2; exit 2 ;;
+    esac
+    found=0
+    for i in "${{!names[@]}}"; do
+        if [ "${{names[$i]}}" = "$key" ]; then
+            flags[$i]="$value"
+            found=1
+        fi
+    done
+    if [ $found -eq 0 ]; then
+        echo "ERROR: Unknown option <--$key>" >&2
+        exit 2
+    fi
+    shift
+done
+
+default_value() {{
+    # Dynamic default: $(cmd)
+    local value="${{defaults[$1]}}"
+    if [[ "$value" == '$('*')' ]]; then
+        value=$(bash -c "${{value:2:${{#value}}-3}}" < /dev/null)
+    fi
+    echo "$value"
+}}
+
+ask() {{
+    local answer
+    if [ -z "${{defaults[$1]}}" ]; then
+        read -r -p "${{messages[$1]}}: " answer < /dev/tty
+    else
+        read -r -p "${{messages[$1]}} (${{defaults[$1]}}): " answer < /dev/tty
+        [ -z "$answer" ] && answer="${{defaults[$1]}}"
+    fi
+    echo "$answer"
+}}
+
+values=()
+for i in "${{!names[@]}}"; do
+    value="${{stdin_values[$i]}}"
+    if [ -z "$value" ]; then
+        if [ -n "${{flags[$i]+x}}" ]; then
+            value="${{flags[$i]}}"
+        else
+            defaults[$i]=$(default_value "$i")
+            value="${{defaults[$i]}}"
+        fi
+        if [ "$value" = "${{defaults[$i]}}" ] && [ "${{always[$i]}}" = 1 ]; then
+            value=$(ask "$i")
+        fi
+    fi
+    if [ -z "$value" ]; then
+        value=$(ask "$i")
+    fi
+    if [ -z "$value" ]; then
+        echo "ERROR: Value for <${{names[$i]}}> must not be empty" >&2
+        exit 2
+    fi
+    values+=("$value")
+done
+
+{run}
+"""
+
+
+class shims:
+    """Static class for command shims
+    """
+
+    @staticmethod
+    def needs_runner(cmd: CommandFile) -> bool:
+        """Check if a command uses headers applied by pbash run (limits, locks, cache, log)
+
+        Args:
+            cmd (CommandFile): command file
+
+        Returns:
+            bool: True if the shim must run the command through pbash
+        """
+        return cmd.cache_ttl > 0 or cmd.timeout > 0 or cmd.maxmem > 0 or cmd.maxcpu > 0 or cmd.nice != 0 \
+            or cmd.max_concurrent > 0 or cmd.log
+
+    @staticmethod
+    def generate(cmd: CommandFile, context: str = "DEFAULT", program: str = "pbash") -> str:
+        """Generate the shim content for a command file
+        Commands with runtime headers are run by pbash run, others are run directly
+
+        Args:
+            cmd (CommandFile): command file
+            context (str, optional): config file section of the store. Defaults to "DEFAULT".
+            program (str, optional): pbash executable. Defaults to "pbash".
+
+        Returns:
+            str: shim content
+        """
+        if shims.needs_runner(cmd):
+            target = " ".join(map(shlex.quote, [program, "-c", context, "run", commands.key(cmd)]))
+        else:
+            target = shlex.quote(cmd.path)
+        if len(cmd.params) == 0:
+            run = f"exec {target}"
+        else:
+            run = f"printf '%s\\n' \"${{values[@]}}\" | exec {target}"
+        return SHIM_TEMPLATE.format(
+            marker=SHIM_MARKER,
+            path=cmd.path,
+            names=" ".join(map(shlex.quote, [p.name for p in cmd.params])),
+            messages=" ".join(map(shlex.quote, [p.message if p.message != "" else p.name for p in cmd.params])),
+            defaults=" ".join(map(shlex.quote, [p.default for p in cmd.params])),
+            always=" ".join(["1" if p.ask_always else "0" for p in cmd.params]),
+            run=run)
+
+    @staticmethod
+    def is_shim(path: str) -> bool:
+        """Check if a file has been generated by pbash
+
+        Args:
+            path (str): file path
+
+        Returns:
+            bool: True if the file is a pbash shim
+        """
+        try:
+            with open(path) as f:
+                f.readline()
+                return f.readline().rstrip("\n") == SHIM_MARKER
+        except (OSError, UnicodeDecodeError):
+            return False
+
+    @staticmethod
+    def install(items: list[CommandFile], bindir: str, prefix: str = "",
+                context: str = "DEFAULT") -> tuple[int, int, int]:
+        """Install shims for all command files
+        Only shims with a changed content are rewritten, and shims of removed commands are deleted
+
+        Args:
+            items (list[CommandFile]): list of command files
+            bindir (str): installation directory
+            prefix (str, optional): shim name prefix. Defaults to "".
+            context (str, optional): config file section of the store. Defaults to "DEFAULT".
+
+        Returns:
+            tuple[int, int, int]: number of written, unchanged and removed shims
+        """
+        if not os.path.exists(bindir):
+            os.makedirs(bindir)
+        assert (os.path.isdir(bindir)), f"Path <{bindir}> is not a valid directory"
+
+        written = 0
+        unchanged = 0
+        program = shutil.which("pbash") or "pbash"
+        installed: set[str] = set()
+        for cmd in items:
+            name = f"{prefix}{cmd.f_name}"
+            shim_path = os.path.join(bindir, name)
+            assert (name not in installed), f"Several commands are named <{cmd.f_name}>"
+            assert (not os.path.exists(shim_path) or shims.is_shim(shim_path)), \
+                f"File <{shim_path}> already exists and is not a pbash shim"
+            installed.add(name)
+            cmd.extract()
+            content = shims.generate(cmd, context, program)
+            if os.path.exists(shim_path):
+                with open(shim_path) as f:
+                    if f.read() == content:
+                        unchanged += 1
+                        continue
+            with open(shim_path, "w") as f:
+                f.write(content)
+            os.chmod(shim_path, stat.S_IRWXU | stat.S_IRGRP | stat.S_IXGRP | stat.S_IROTH | stat.S_IXOTH)
+            written += 1
+
+        removed = 0
+        for f in os.listdir(bindir):
+            shim_path = os.path.join(bindir, f)
+            if f.startswith(prefix) and f not in installed and shims.is_shim(shim_path):
+                os.remove(shim_path)
+                removed += 1
+
+        return written, unchanged, removed
@@ -0,0 +1,71 @@
+# Copyright (C) 2022 Sebastien Guerri
+#
+# This file is part of pbash.
+#
+# pbash is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# pbash is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Handle application state stored in the store directory
+"""
+
+import os
+import hashlib
+
+from pathlib import Path
+
+
+STATE_DIR = ".pbash"
+
+
+class state:
+    """Static class for application state
+    """
+
+    @staticmethod
+    def path(store: str, *parts: str) -> str:
+        """Return a path inside the state directory of a store
+        The directory is created if needed, and ignored by git
+
+        Args:
+            store (str): store path
+            parts (str...): path elements inside the state directory
+
+        Returns:
+            str: state path
+        """
+        if os.path.isfile(store):
+            # Read-only bundle: state is kept in the user cache directory
+            root = state.cache_path("state", hashlib.sha1(os.path.abspath(store).encode()).hexdigest())
+        else:
+            root = os.path.join(store, STATE_DIR)
+        if not os.path.exists(root):
+            os.makedirs(root, exist_ok=True)
+            with open(os.path.join(root, ".gitignore"), "w") as f:
+                f.write("*\n")
+        path = os.path.join(root, *parts)
+        if len(parts) > 0:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    @staticmethod
+    def cache_path(*parts: str) -> str:
+        """Return a path inside the user cache directory of the application
+
+        Args:
+            parts (str...): path elements inside the cache directory
+
+        Returns:
+            str: cache path
+        """
+        root = os.environ.get("XDG_CACHE_HOME", "") or os.path.join(Path.home(), ".cache")
+        return os.path.join(root, "pbash", *parts)
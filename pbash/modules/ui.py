@@ -18,7 +18,9 @@
 """Utils for handling cli ui display
 """
 
+import sys
 import json
+import time
 
 from rich import print
 from rich.prompt import Prompt
@@ -27,6 +29,8 @@ from rich.prompt import Confirm
 from rich.console import Console
 from rich.table import Table
 
+from .picker import Picker
+
 
 class ui:
     """Static class for handling cli ui
@@ -160,6 +164,24 @@ class ui:
         ui.show_table(json_content, show_unique=True)
         return json_content
 
+    @staticmethod
+    def show_shadowed(data) -> json:
+        """Show the list of shadowed command files
+
+        Args:
+            data: list of command files
+
+        Returns:
+            json: list of command files in JSON format
+        """
+        json_items = list(map(lambda p: [p.root_name, p.f_name, p.path], data))
+        json_content = {}
+        json_content["headers"] = [{"name": "Folder"}, {"name": "Shadowed file"}, {"name": "Path", "ratio": 2}]
+        json_content["rows"] = json_items
+        json_content["content"] = data
+        ui.show_table(json_content, show_unique=True)
+        return json_content
+
     @staticmethod
     def select_command(data) -> json:
         """Select a command file
@@ -170,5 +192,99 @@ class ui:
         Returns:
             json: selected command file
         """
+        if len(data) > 1 and sys.stdin.isatty() and sys.stdout.isatty():
+            # Type-ahead picker, the table is only used without terminal
+            labels = list(map(lambda p: f"{(p.root_name.strip('/') + '/' + p.f_name).lstrip('/'):<40} {p.desc}", data))
+            index = Picker(labels).select()
+            assert (index is not None), "Command selection has been cancelled"
+            return data[index]
         json_content = ui.show_commands(data)
         return ui.select_table(json_content)
+
+    @staticmethod
+    def show_checks(data) -> json:
+        """Show the errors of command files
+
+        Args:
+            data: list of check results
+
+        Returns:
+            json: list of errors in JSON format
+        """
+        json_items = [[r.cmd.root_name, r.cmd.f_name, error] for r in data for error in r.errors]
+        json_content = {}
+        json_content["headers"] = [{"name": "Folder"}, {"name": "File"}, {"name": "Error", "ratio": 3}]
+        json_content["rows"] = json_items
+        json_content["content"] = data
+        ui.show_table(json_content, show_unique=True)
+        return json_content
+
+    @staticmethod
+    def show_steps(data, critical) -> json:
+        """Show the report of a run with dependencies
+
+        Args:
+            data: list of steps
+            critical: list of steps in the critical path
+
+        Returns:
+            json: list of steps in JSON format
+        """
+        start = min([s.result.started for s in data if s.result is not None], default=0)
+        json_items = list(map(lambda s: [
+            s.cmd.f_name,
+            s.status if s.error == "" else f"{s.status}: {s.error}",
+            "" if s.result is None else f"+{s.result.started - start:.2f}s",
+            "" if s.result is None else f"{s.result.duration:.2f}s",
+            "*" if s in critical else ""], data))
+        json_content = {}
+        json_content["headers"] = [{"name": "Command"}, {"name": "Status", "ratio": 2}, {"name": "Start"},
+                                   {"name": "Duration"}, {"name": "Critical"}]
+        json_content["rows"] = json_items
+        json_content["content"] = data
+        ui.show_table(json_content, show_unique=True)
+        return json_content
+
+    @staticmethod
+    def show_logs(data) -> json:
+        """Show the list of logs
+
+        Args:
+            data: list of logs
+
+        Returns:
+            json: list of logs in JSON format
+        """
+        json_items = list(map(lambda r: [time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(r.started)),
+                                         str(r.code), f"{r.duration:.2f}s", f"{r.size / 1024:.1f}k"], data))
+        json_content = {}
+        json_content["headers"] = [{"name": "Date"}, {"name": "Exit code"}, {"name": "Duration"}, {"name": "Size"}]
+        json_content["rows"] = json_items
+        json_content["content"] = data
+        ui.show_table(json_content, show_unique=True)
+        return json_content
+
+    @staticmethod
+    def show_jobs(data) -> json:
+        """Show the list of jobs
+
+        Args:
+            data: list of jobs
+
+        Returns:
+            json: list of jobs in JSON format
+        """
+        json_items = list(map(lambda j: [
+            str(j.id),
+            j.name,
+            j.status if j.error in [None, ""] else f"{j.status}: {j.error}",
+            time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(j.submitted)),
+            "" if j.finished is None else f"{j.finished - j.started:.2f}s",
+            "" if j.code is None else str(j.code)], data))
+        json_content = {}
+        json_content["headers"] = [{"name": "Id"}, {"name": "Command"}, {"name": "Status", "ratio": 2},
+                                   {"name": "Submitted"}, {"name": "Duration"}, {"name": "Exit code"}]
+        json_content["rows"] = json_items
+        json_content["content"] = data
+        ui.show_table(json_content, show_unique=True, show_index=False)
+        return json_content
@@ -0,0 +1,72 @@
+# Copyright (C) 2022 Sebastien Guerri
+#
+# This file is part of pbash.
+#
+# pbash is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# pbash is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Utils for parsing header values with units
+"""
+
+
+DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+SIZE_UNITS = {"b": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3, "t": 1024 ** 4}
+
+
+class units:
+    """Static class for parsing values with units
+    """
+
+    @staticmethod
+    def parse(value: str, factors: dict[str, int], default_unit: str) -> int:
+        """Parse a number followed by an optional unit
+
+        Args:
+            value (str): value to parse (ex: 10, 5m, 2G)
+            factors (dict[str, int]): multiplying factor for each unit
+            default_unit (str): unit used when none is given
+
+        Returns:
+            int: parsed value
+        """
+        content = value.strip().lower()
+        unit = default_unit
+        if content != "" and content[-1] in factors:
+            unit = content[-1]
+            content = content[:-1].strip()
+        assert (content.isdigit()), f"Incorrect value <{value}>"
+        return int(content) * factors[unit]
+
+    @staticmethod
+    def duration(value: str) -> int:
+        """Parse a duration (s, m, h, d)
+
+        Args:
+            value (str): value to parse (ex: 30, 30s, 5m, 1h)
+
+        Returns:
+            int: duration in seconds
+        """
+        return units.parse(value, DURATION_UNITS, "s")
+
+    @staticmethod
+    def size(value: str) -> int:
+        """Parse a size (b, k, m, g, t)
+
+        Args:
+            value (str): value to parse (ex: 512, 64k, 1G)
+
+        Returns:
+            int: size in bytes
+        """
+        return units.parse(value, SIZE_UNITS, "b")
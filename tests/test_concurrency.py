@@ -0,0 +1,94 @@
+# Copyright (C) 2022 Sebastien Guerri
+#
+# This file is part of pbash.
+#
+# pbash is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# pbash is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Stress concurrent writes of the config file and the store state
+"""
+
+import os
+import sys
+import json
+import threading
+import subprocess
+import configparser
+
+PROCESSES = 8
+ROUNDS = 5
+
+# Each process changes the DEFAULT store, lists commands (state and metrics writes) and adds its own sections
+WORKER = """
+import sys
+from click.testing import CliRunner
+from pbash.app import cli
+from pbash.appConfig import AppConfig, Config
+
+index, rounds, rcpath, store = int(sys.argv[1]), int(sys.argv[2]), sys.argv[3], sys.argv[4]
+runner = CliRunner()
+for i in range(rounds):
+    for args in (["init", "--path", store], ["list"]):
+        result = runner.invoke(cli, args, obj={})
+        assert result.exit_code == 0, f"{args}: {result.output}"
+    AppConfig.add_section(rcpath, f"P{index}R{i}", Config(rcpath))
+"""
+
+
+def test_concurrent_config_and_state_writes(tmp_path):
+    home = tmp_path / "home"
+    home.mkdir()
+    stores = []
+    for i in range(PROCESSES):
+        store = tmp_path / f"store{i}"
+        store.mkdir()
+        (store / "hello.sh").write_text("#!/bin/bash\n#DESC hello\necho hello\n")
+        stores.append(f"{store}{os.sep}")
+    rcpath = home / ".pbashrc"
+    rcpath.write_text(f"[DEFAULT]\npath = {stores[0]}\n")
+
+    # Reader parsing the config file during the whole run
+    errors = []
+    done = threading.Event()
+
+    def read():
+        while not done.is_set():
+            cfg = configparser.ConfigParser()
+            try:
+                cfg.read_string(rcpath.read_text())
+                assert cfg["DEFAULT"]["path"] in stores
+            except Exception as error:
+                errors.append(repr(error))
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    env = dict(os.environ, HOME=str(home))
+    try:
+        processes = [subprocess.Popen([sys.executable, "-c", WORKER, str(i), str(ROUNDS), str(rcpath), stores[i]],
+                                      env=env, cwd=str(tmp_path), stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+                     for i in range(PROCESSES)]
+        outputs = [(p.wait(120), p.stdout.read().decode()) for p in processes]
+    finally:
+        done.set()
+        reader.join()
+
+    assert [output for code, output in outputs if code != 0] == []
+    assert errors == []
+    cfg = configparser.ConfigParser()
+    cfg.read(rcpath)
+    # No lost update
+    assert set(cfg.sections()) == {f"P{i}R{r}" for i in range(PROCESSES) for r in range(ROUNDS)}
+    assert cfg["DEFAULT"]["path"] in stores
+    for store in stores:
+        with open(os.path.join(store, ".pbash", "metrics.json")) as f:
+            json.load(f)